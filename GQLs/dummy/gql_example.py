@@ -1,13 +1,26 @@
 from ktxo.prefect.admin.gql.base import GQLBase
+from ktxo.prefect.admin.gql.schema import Column
 
 class GQLLog(GQLBase):
     def __init__(self):
         super().__init__(
-            gql_string="""query F($where_:log_bool_exp){
-  log (where: $where_){
-    id,flow_run_id,name,message
+            gql_string="""query F($where_:log_bool_exp,$limit:Int,$offset:Int){
+  log (where: $where_,limit:$limit,offset:$offset,order_by:[{timestamp:asc},{id:asc}]){
+    {selection}
   }
 }""",
             object="log",
-            fields=["id","flow_run_id","name", "message"],
-            cols=None)
+            schema=[Column("id", "ID"),
+                    Column("flow_run_id", "FLOW_RUN_ID"),
+                    Column("name", "NAME"),
+                    Column("message", "MESSAGE")],
+            paged=True,
+            watermark="timestamp")
+
+    def watermark_variables(self, variables:dict, watermark:str) -> dict:
+        if watermark is None:
+            return variables
+        where_ = {"timestamp": {"_gte": watermark}}
+        if variables.get("where_"):
+            where_ = {"_and": [variables["where_"], where_]}
+        return {**variables, "where_": where_}
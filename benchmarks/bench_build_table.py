@@ -0,0 +1,58 @@
+"""
+Micro benchmark: GQLBase.build_table rows/s against the per cell jmespath.search + strptime loop it replaced
+
+python benchmarks/bench_build_table.py [ROWS]
+"""
+import datetime
+import os
+import random
+import sys
+import time
+import jmespath
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from ktxo.prefect.admin.gql.base import GQLBase
+from ktxo.prefect.admin.gql.gql_admin import GQLFlowRunList
+
+def flow_runs(n:int):
+    base = datetime.datetime(2021, 12, 1, tzinfo=datetime.timezone.utc)
+    rows = []
+    for i in range(n):
+        start = base + datetime.timedelta(minutes=random.randint(0, 20000))
+        rows.append({"id": f"run-{i}", "version": 1, "name": f"run-{i}",
+                     "agent": {"id": "agent-1", "name": "AGENT1"},
+                     "state": random.choice(["Success", "Failed", "Running"]), "state_message": "",
+                     "scheduled_start_time": start.isoformat(timespec="microseconds"),
+                     "start_time": start.isoformat(timespec="microseconds"),
+                     "end_time": (start + datetime.timedelta(seconds=30)).isoformat(timespec="microseconds"),
+                     "labels": ["L1"], "run_config": {"labels": ["L1"], "type": "UniversalRun"}})
+    return rows
+
+def build_table_per_cell(gql:GQLBase, values):
+    """build_table before the extraction plan"""
+    table = []
+    for v in values:
+        value = []
+        for r in gql.fields:
+            elem = jmespath.search(r, v)
+            if r in GQLBase.DATE_TIME_FIELDS and elem is not None:
+                value.append(datetime.datetime.strptime(elem, '%Y-%m-%dT%H:%M:%S.%f%z').astimezone().strftime('%Y-%m-%d_%H:%M:%S'))
+            else:
+                value.append(elem)
+        table.append(value)
+    return table
+
+def rows_per_second(fn, values):
+    start = time.perf_counter()
+    table = fn(values)
+    return len(values) / (time.perf_counter() - start), table
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    gql = GQLFlowRunList()
+    values = flow_runs(n)
+    before, t1 = rows_per_second(lambda v: build_table_per_cell(gql, v), values)
+    after, t2 = rows_per_second(gql.build_table, values)
+    assert t1 == t2
+    print(f"rows={n} per_cell={before:,.0f} rows/s plan={after:,.0f} rows/s speedup={after / before:.1f}x")
@@ -0,0 +1,252 @@
+"""
+Local stand-in for Prefect GraphQL API, only for benchmarks
+- Synthetic 'flow', 'flow_run', 'flow_group', 'agents', 'project', 'secret_names', 'secret_value' and 'log' data
+- Understands the subset of GraphQL used by the GQL classes: aliases, variables, limit/offset, distinct_on,
+  'where' (Hasura bool_exp subset), 'order_by' on scalar fields and selection sets
+- Mutations (set_schedule_*, set_flow_group_default_parameters) always succeed
+- Counts requests and bytes, see FakePrefectServer.stats()
+
+python benchmarks/fake_server.py [--port PORT] [--flows N] ... to run it standalone
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ktxo.prefect.admin.gql.graphql import Field, parse_arguments, parse_document, project
+
+STATES = ["Success", "Failed", "Running", "Scheduled", "Cancelled"]
+
+#---------------------------------------------------------------------------
+#   Synthetic data
+#---------------------------------------------------------------------------
+def _ts(d:datetime.datetime) -> str:
+    return d.isoformat(timespec="microseconds")
+
+def build_data(flows:int=200, flow_runs:int=5000, agents:int=10, projects:int=10, secrets:int=100, logs:int=20000, seed:int=1) -> Dict[str, List]:
+    rnd = random.Random(seed)
+    uid = lambda: str(uuid.UUID(int=rnd.getrandbits(128)))
+    base = datetime.datetime(2021, 12, 1, tzinfo=datetime.timezone.utc)
+    data = {"agents": [], "project": [], "flow": [], "flow_group": [], "flow_run": [], "log": [],
+            "secret_names": [f"SECRET_{i}" for i in range(secrets)]}
+    for i in range(agents):
+        data["agents"].append({"id": uid(), "core_version": "0.15.4", "name": f"AGENT{i}", "type": "LocalAgent",
+                               "created": _ts(base), "updated": _ts(base), "last_queried": _ts(base), "labels": [f"L{i % 3}"]})
+    for i in range(projects):
+        data["project"].append({"id": uid(), "name": f"PROJECT{i}", "description": f"Project {i}",
+                                "flows_aggregate": {"aggregate": {"count": flows // max(projects, 1)}}})
+    for i in range(flows):
+        group = {"id": uid(), "default_parameters": {"A": i % 5}}
+        data["flow_group"].append(group)
+        data["flow"].append({"id": uid(), "version": 1 + i % 3, "name": f"FLOW_{i % max(flows // 3, 1)}", "archived": i % 10 == 0,
+                             "created": _ts(base + datetime.timedelta(hours=i)), "updated": _ts(base + datetime.timedelta(hours=i)),
+                             "is_schedule_active": i % 2 == 0, "flow_group_id": group["id"], "flow_group": group,
+                             "run_config": {"type": "UniversalRun", "labels": [f"L{i % 3}"], "env": {f"K{k}": "x" * 40 for k in range(20)}},
+                             "parameters": [{"name": "A", "default": 1, "required": False}]})
+    for i in range(flow_runs):
+        flow = data["flow"][rnd.randrange(flows)] if flows else {"name": None, "run_config": None}
+        agent = data["agents"][rnd.randrange(agents)] if agents else None
+        start = base + datetime.timedelta(minutes=rnd.randrange(60 * 24 * 30))
+        data["flow_run"].append({"id": uid(), "version": 1, "name": f"run-{i}", "flow_id": flow.get("id"), "flow": {"name": flow["name"]},
+                                 "state": rnd.choice(STATES), "state_message": "", "agent": agent and {"id": agent["id"], "name": agent["name"]},
+                                 "scheduled_start_time": _ts(start), "start_time": _ts(start),
+                                 "end_time": _ts(start + datetime.timedelta(seconds=rnd.randrange(1, 3600))),
+                                 "updated": _ts(start), "labels": ["L1"], "run_config": flow["run_config"]})
+    runs = data["flow_run"] or [{"id": None, "start_time": _ts(base)}]
+    for i in range(logs):
+        run = runs[i % len(runs)]
+        data["log"].append({"id": uid(), "flow_run_id": run["id"], "name": "prefect.CloudTaskRunner", "level": "INFO",
+                            "message": f"Task 'task_{i % 7}': Finished task run for task with final state: 'Success'",
+                            "timestamp": _ts(datetime.datetime.fromisoformat(run["start_time"]) + datetime.timedelta(seconds=i // len(runs)))})
+    return data
+
+#---------------------------------------------------------------------------
+#   Resolvers
+#---------------------------------------------------------------------------
+_OPERATORS = {"_eq": lambda a, b: a == b, "_neq": lambda a, b: a != b,
+              "_gt": lambda a, b: a is not None and a > b, "_gte": lambda a, b: a is not None and a >= b,
+              "_lt": lambda a, b: a is not None and a < b, "_lte": lambda a, b: a is not None and a <= b,
+              "_in": lambda a, b: a in b, "_nin": lambda a, b: a not in b,
+              "_is_null": lambda a, b: (a is None) == b}
+
+def compile_where(where):
+    """Predicate for a Hasura bool_exp subset, a null comparison value matches everything (as old Hasura versions do)"""
+    tests = []
+    for key, cond in (where or {}).items():
+        if key in ("_and", "_or") and isinstance(cond, dict):
+            cond = [cond]
+        if key == "_and":
+            parts = [compile_where(c) for c in cond or []]
+            tests.append(lambda row, parts=parts: all(p(row) for p in parts))
+        elif key == "_or":
+            if cond:
+                parts = [compile_where(c) for c in cond]
+                tests.append(lambda row, parts=parts: any(p(row) for p in parts))
+        elif key == "_not":
+            if cond:
+                part = compile_where(cond)
+                tests.append(lambda row, part=part: not part(row))
+        elif cond is None:
+            continue
+        elif any(k in _OPERATORS for k in cond):
+            ops = [(_OPERATORS[op], b) for op, b in cond.items() if b is not None]
+            tests.append(lambda row, key=key, ops=ops: all(op(row.get(key) if isinstance(row, dict) else None, b) for op, b in ops))
+        else:
+            part = compile_where(cond)
+            def nested(row, key=key, part=part):
+                value = row.get(key) if isinstance(row, dict) else None
+                return any(part(v) for v in value) if isinstance(value, list) else part(value)
+            tests.append(nested)
+    if len(tests) == 1:
+        return tests[0]
+    return lambda row: all(t(row) for t in tests)
+
+class Resolver():
+    def __init__(self, data:Dict[str, List]):
+        self.data = data
+        # Recent 'where' results, aliased aggregates share the first '_and' condition (data never changes)
+        self._filtered = {}
+
+    def resolve(self, field:Field, variables:dict):
+        args = parse_arguments(field.args, variables)
+        name = field.name
+        if name.startswith("set_"):
+            return {"success": True}
+        if name == "secret_names":
+            return list(self.data["secret_names"])
+        if name == "secret_value":
+            return f"value-of-{args.get('name')}"
+        if name.endswith("_aggregate"):
+            rows = self.filter(name[:-len("_aggregate")], args)
+            return {"aggregate": {"count": len(rows)}}
+        rows = self.order(self.filter(name, args), args.get("order_by"))
+        offset = args.get("offset") or 0
+        limit = args.get("limit")
+        return rows[offset:None if limit is None else offset + limit]
+
+    def filter(self, object:str, args:dict) -> List:
+        rows = self.where(object, args.get("where"))
+        distinct_on = args.get("distinct_on")
+        if distinct_on:
+            columns = distinct_on if isinstance(distinct_on, list) else [distinct_on]
+            seen = set()
+            rows = [r for r in rows if not (tuple(r.get(c) for c in columns) in seen or seen.add(tuple(r.get(c) for c in columns)))]
+        return rows
+
+    def order(self, rows:List, order_by) -> List:
+        items = order_by if isinstance(order_by, list) else [order_by] if order_by else []
+        keys = [(k, d) for item in items for k, d in item.items() if isinstance(d, str)]
+        for key, direction in reversed(keys):
+            rows = sorted(rows, key=lambda r: (r.get(key) is None, r.get(key) or ""), reverse=direction.startswith("desc"))
+        return rows
+
+    def where(self, object:str, where:dict) -> List:
+        conditions = where.get("_and") if where and len(where) == 1 else None
+        if isinstance(conditions, list) and len(conditions) > 1:
+            rest = compile_where({"_and": conditions[1:]})
+            return [r for r in self.where(object, conditions[0]) if rest(r)]
+        key = (object, json.dumps(where, sort_keys=True))
+        rows = self._filtered.get(key)
+        if rows is None:
+            test = compile_where(where)
+            rows = [r for r in self.data.get(object, []) if test(r)]
+            if len(self._filtered) >= 32:
+                self._filtered.clear()
+            self._filtered[key] = rows
+        return rows
+
+#---------------------------------------------------------------------------
+#   HTTP server
+#---------------------------------------------------------------------------
+class FakePrefectServer():
+    def __init__(self, data:Dict[str, List], latency:float=0.0, host:str="127.0.0.1", port:int=0):
+        self.resolver = Resolver(data)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.reset()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are sent apart, with Nagle small responses wait for the delayed ACK (~40ms)
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                response = server.handle(body)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+                with server.lock:
+                    server.counters["requests"] += 1
+                    server.counters["bytes_in"] += len(body)
+                    server.counters["bytes_out"] += len(response)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle(self, body:bytes) -> bytes:
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            request = json.loads(body)
+            variables = request.get("variables") or {}
+            if isinstance(variables, str):
+                variables = json.loads(variables) or {}
+            _, fields = parse_document(request["query"])
+            data = {f.alias: project(self.resolver.resolve(f, variables), f) for f in fields}
+            return json.dumps({"data": data}).encode("utf-8")
+        except Exception as e:
+            return json.dumps({"errors": [{"message": f"{type(e).__name__}: {str(e)}"}]}).encode("utf-8")
+
+    def reset(self):
+        with self.lock:
+            self.counters = {"requests": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Prefect GraphQL API")
+    parser.add_argument("--port", type=int, default=4200)
+    parser.add_argument("--latency", metavar="MS", type=float, default=0)
+    for name, default in [("flows", 200), ("flow-runs", 5000), ("agents", 10), ("projects", 10), ("secrets", 100), ("logs", 20000)]:
+        parser.add_argument(f"--{name}", type=int, default=default)
+    args = parser.parse_args()
+    server = FakePrefectServer(build_data(args.flows, args.flow_runs, args.agents, args.projects, args.secrets, args.logs),
+                               latency=args.latency / 1000, port=args.port)
+    print(f"Listening on {server.url}, use: PREFECT__BACKEND=server PREFECT__SERVER__ENDPOINT={server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
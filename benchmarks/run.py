@@ -0,0 +1,184 @@
+"""
+Benchmark suite, runs offline against benchmarks/fake_server.py
+
+For each GQL class and CLI command it reports:
+- latency: wall time (CLI: includes interpreter start and imports)
+- requests, bytes_out/bytes_in: counted by the fake server
+- rows/s: GQLBase.build_table over the rows returned
+- peak RSS: max resident memory (CLI: of the child process (Linux), classes: of this process so far)
+
+Results are saved as JSON in --out and compared with the previous result file (regressions are flagged)
+
+python benchmarks/run.py [--flow-runs N] [--latency MS] [--repeat N] [--out DIR]
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[0:0] = [ROOT, os.path.join(ROOT, "GQLs")]
+
+from benchmarks.fake_server import FakePrefectServer, build_data
+from ktxo.prefect.admin.gql.base import GQLBase
+
+REGRESSION = 1.2
+
+def scenarios(data:dict):
+    """(name, class path, execute args, extra call) for each GQL class"""
+    flow = data["flow"][1]
+    run_id = data["flow_run"][0]["id"] if data["flow_run"] else None
+    flow_ids = [f["id"] for f in data["flow"]]
+    groups = [{"flow_group_id": f["flow_group_id"], "parameters": {"A": 1}} for f in data["flow"]]
+    return [
+        ("agent_list", "ktxo.prefect.admin.gql.gql_admin.GQLAgentList", {}, None),
+        ("project_list", "ktxo.prefect.admin.gql.gql_admin.GQLProjectList", {}, None),
+        ("flow_list", "ktxo.prefect.admin.gql.gql_admin.GQLFlowList", {"archived": False}, None),
+        ("flow_query", "ktxo.prefect.admin.gql.gql_admin.GQLFlowQuery", {"flow_name": flow["name"], "archived": False}, None),
+        ("flow_run_list", "ktxo.prefect.admin.gql.gql_admin.GQLFlowRunList", {"flow_name": flow["name"]}, None),
+        ("flow_run_stats", "ktxo.prefect.admin.gql.gql_admin.GQLFlowRunStats", {"since": "2021-12-01T00:00:00+00:00", "flow_name": flow["name"]}, None),
+        ("secret_list", "ktxo.prefect.admin.gql.gql_admin.GQLSecretList", "all", None),
+        ("secret_query_all", "ktxo.prefect.admin.gql.gql_admin.GQLSecretQuery", "all", None),
+        ("log", "dummy.gql_example.GQLLog", {"where_": {"flow_run_id": {"_eq": run_id}}}, None),
+        ("schedule_disable_bulk", "ktxo.prefect.admin.gql.gql_admin.GQLFlowScheduleDisable", [{"flow_id": i} for i in flow_ids], "execute_many"),
+        ("set_parameter_bulk", "ktxo.prefect.admin.gql.gql_admin.GQLSetParameter", groups, "execute_many"),
+    ]
+
+def commands(data:dict):
+    flow = data["flow"][1]
+    return [
+        ("cli_version", ["-v"]),
+        ("cli_agent_list", ["agent", "-l"]),
+        ("cli_flow_list", ["flow", "-l"]),
+        ("cli_flow_list_ndjson", ["-f", "ndjson", "flow", "-l"]),
+        ("cli_flow_run_list", ["flow_run", "-l", flow["name"]]),
+        ("cli_flow_run_stats", ["flow_run", "--stats", "--since", "2021-12-01", "-l", flow["name"]]),
+        ("cli_secret_query_all", ["secret", "-q", "all"]),
+    ]
+
+def load_class(package_class:str):
+    import importlib
+    module = importlib.import_module(".".join(package_class.split(".")[:-1]))
+    return getattr(module, package_class.split(".")[-1])
+
+def peak_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def bench_class(server:FakePrefectServer, package_class:str, variables, call:str=None):
+    gql = load_class(package_class)()
+    server.reset()
+    start = time.perf_counter()
+    if call is None:
+        gql.execute(variables)
+        values = gql.values
+    else:
+        getattr(gql, call)(variables)
+        values = gql.values
+        failed = gql.failed() if hasattr(gql, "failed") else []
+        if failed:
+            raise RuntimeError(f"{package_class}.{call}: {len(failed)} of {len(values)} items failed")
+    latency = time.perf_counter() - start
+    stats = server.stats()
+    start = time.perf_counter()
+    table = gql.build_table(values)
+    extract = time.perf_counter() - start
+    rows = len(table or [])
+    # rows/s only for classes extracting fields, others return values as rows
+    extracted = type(gql).build_table is GQLBase.build_table
+    return {"latency_s": latency, "requests": stats["requests"], "bytes_out": stats["bytes_out"], "bytes_in": stats["bytes_in"],
+            "rows": rows, "rows_per_s": rows / extract if extracted and extract > 0 and rows else None, "peak_rss_kb": peak_rss_kb()}
+
+# ru_maxrss of a child keeps the parent value across fork/exec, VmHWM is reset by exec
+CLI = """
+import atexit, runpy, sys
+def hwm():
+    with open("/proc/self/status") as fd:
+        sys.stderr.write([l for l in fd if l.startswith("VmHWM")][0])
+atexit.register(hwm)
+sys.argv = ["prefect_wrapper"] + sys.argv[1:]
+runpy.run_module("ktxo.prefect.admin.prefect_wrapper", run_name="__main__")
+"""
+
+def bench_command(server:FakePrefectServer, argv:list, env:dict):
+    server.reset()
+    start = time.perf_counter()
+    p = subprocess.run([sys.executable, "-c", CLI] + argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    latency = time.perf_counter() - start
+    stderr = p.stderr.decode("utf-8", "replace")
+    if p.returncode != 0:
+        raise RuntimeError(f"{argv} failed, rc={p.returncode}\n{stderr}")
+    stats = server.stats()
+    peak_rss = [int(l.split()[1]) for l in stderr.splitlines() if l.startswith("VmHWM")]
+    return {"latency_s": latency, "requests": stats["requests"], "bytes_out": stats["bytes_out"], "bytes_in": stats["bytes_in"],
+            "peak_rss_kb": peak_rss[0] if peak_rss else None}
+
+def best(results:list) -> dict:
+    """Keep the fastest repetition"""
+    return min(results, key=lambda r: r["latency_s"])
+
+def compare(current:dict, previous:dict, previous_file:str):
+    print(f"\nCompared with {os.path.basename(previous_file)} (flagged: {REGRESSION - 1:.0%} worse)")
+    for name, r in current["results"].items():
+        p = previous["results"].get(name)
+        if p is None:
+            continue
+        flags = []
+        for metric in ["latency_s", "requests", "bytes_out", "peak_rss_kb"]:
+            if p.get(metric) and r.get(metric) is not None and r[metric] > p[metric] * REGRESSION:
+                flags.append(f"{metric} {p[metric]:.4g} -> {r[metric]:.4g}")
+        if p.get("rows_per_s") and r.get("rows_per_s") and r["rows_per_s"] * REGRESSION < p["rows_per_s"]:
+            flags.append(f"rows_per_s {p['rows_per_s']:.4g} -> {r['rows_per_s']:.4g}")
+        if flags:
+            print(f"  REGRESSION {name}: {', '.join(flags)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="prefect_wrapper benchmarks (offline)")
+    for name, default in [("flows", 300), ("flow-runs", 20000), ("agents", 10), ("projects", 10), ("secrets", 300), ("logs", 50000)]:
+        parser.add_argument(f"--{name}", type=int, default=default)
+    parser.add_argument("--latency", metavar="MS", help="Latency added by the server to each request", type=float, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", metavar="DIR", default=os.path.join(ROOT, "benchmarks", "results"))
+    parser.add_argument("--no-cli", help="Skip CLI commands", action='store_true')
+    parser.add_argument("--only", metavar="NAME", help="Run only scenarios containing NAME", nargs='+')
+    args = parser.parse_args()
+
+    data = build_data(args.flows, args.flow_runs, args.agents, args.projects, args.secrets, args.logs)
+    server = FakePrefectServer(data, latency=args.latency / 1000).start()
+    env = dict(os.environ, PREFECT__BACKEND="server", PREFECT__SERVER__ENDPOINT=server.url,
+               PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, "GQLs"), os.environ.get("PYTHONPATH", "")]))
+    os.environ.update({k: env[k] for k in ["PREFECT__BACKEND", "PREFECT__SERVER__ENDPOINT"]})
+    selected = lambda name: not args.only or any(o in name for o in args.only)
+
+    from ktxo.prefect.admin import _about as about
+    results = {}
+    print(f"{'NAME':<24} {'LATENCY_S':>10} {'REQUESTS':>8} {'BYTES_OUT':>12} {'ROWS':>7} {'ROWS/S':>10} {'PEAK_RSS_KB':>11}")
+    todo = [(n, lambda c=c, v=v, k=k: bench_class(server, c, v, k)) for n, c, v, k in scenarios(data)]
+    if not args.no_cli:
+        todo += [(n, lambda a=a: bench_command(server, a, env)) for n, a in commands(data)]
+    for name, fn in todo:
+        if not selected(name):
+            continue
+        r = best([fn() for _ in range(args.repeat)])
+        results[name] = r
+        rows_per_s = f"{r['rows_per_s']:,.0f}" if r.get("rows_per_s") else "-"
+        print(f"{name:<24} {r['latency_s']:>10.4f} {r['requests']:>8} {r['bytes_out']:>12,} {r.get('rows', '-'):>7} {rows_per_s:>10} {r['peak_rss_kb']:>11,}")
+    server.stop()
+
+    current = {"version": about.__version__, "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+               "config": vars(args), "results": results}
+    os.makedirs(args.out, exist_ok=True)
+    previous_files = sorted(glob.glob(os.path.join(args.out, "*.json")), key=os.path.getmtime)
+    file = os.path.join(args.out, f"{about.__version__}-{time.strftime('%Y%m%d%H%M%S')}.json")
+    with open(file, "w") as fd:
+        json.dump(current, fd, indent=2)
+    print(f"\nSaved {file}")
+    if previous_files:
+        with open(previous_files[-1]) as fd:
+            compare(current, json.load(fd), previous_files[-1])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+asyncio transport for GQL classes (see GQLBase.execute_async)
+- httpx.AsyncClient (HTTP/2 when 'h2' is installed) when httpx is installed, otherwise the pooled
+  requests sessions of the client on a thread pool
+- at most 'concurrency' requests in flight, retries on 429/5xx and connection errors
+  with full jitter exponential backoff (or the server's Retry-After)
+"""
+import asyncio
+import json
+import random
+from typing import List, Tuple
+
+from ktxo.prefect.admin.gql.client import decode_response, request_headers
+from ktxo.prefect.admin.gql.profile import profiler
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RETRIES = 4
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+class TransportError(Exception):
+    def __init__(self, message:str, status:int=None):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncTransport():
+    def __init__(self, client, concurrency:int=DEFAULT_CONCURRENCY, retries:int=DEFAULT_RETRIES, backoff:float=0.5, max_backoff:float=30):
+        import prefect
+        self.client = client
+        self.url = client.api_server
+        self.headers = request_headers(client)
+        self.timeout = prefect.context.config.cloud.request_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._http = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created on first use, inside the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def http(self):
+        if self._http is None:
+            try:
+                import httpx
+            except ImportError:
+                return None
+            limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            try:
+                self._http = httpx.AsyncClient(http2=True, limits=limits, timeout=self.timeout)
+            except ImportError:
+                # http2=True needs 'h2'
+                self._http = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+        return self._http
+
+    async def _send(self, body:bytes) -> Tuple[int, bytes, dict]:
+        http = self.http()
+        if http is not None:
+            import httpx
+            try:
+                response = await http.post(self.url, content=body, headers=self.headers)
+            except httpx.TransportError as e:
+                raise TransportError(str(e))
+            return response.status_code, response.content, response.headers
+        import requests
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(None, lambda: self.client.session.post(self.url, data=body, headers=self.headers, timeout=self.timeout))
+        except requests.exceptions.RequestException as e:
+            raise TransportError(str(e))
+        return response.status_code, response.content, response.headers
+
+    def delay(self, attempt:int, retry_after:str=None) -> float:
+        try:
+            return min(float(retry_after), self.max_backoff)
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def post(self, query:str, variables:dict=None) -> dict:
+        """Send query, return the response {"data": ..., "errors": ...}"""
+        if isinstance(variables, str):
+            variables = json.loads(variables)
+        body = json.dumps({"query": query, "variables": variables or {}}).encode("utf-8")
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    status, content, headers = await self._send(body)
+                except TransportError:
+                    if attempt == self.retries:
+                        raise
+                    profiler.count("retries")
+                    await asyncio.sleep(self.delay(attempt))
+                    continue
+                profiler.count("requests")
+                profiler.count("response_bytes", len(content))
+                if status in RETRY_STATUS and attempt < self.retries:
+                    profiler.count("retries")
+                    await asyncio.sleep(self.delay(attempt, headers.get("Retry-After")))
+                    continue
+                if status >= 400:
+                    raise TransportError(f"HTTP {status} from {self.url}: {content[:200]!r}", status)
+                return decode_response(content, raise_on_error=False)
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+def execute_all(items:List[Tuple[object, dict]], concurrency:int=DEFAULT_CONCURRENCY) -> List:
+    """
+    Run execute_async() of each (gql, variables) on one event loop, one transport per client,
+    return the GQL instances in the same order
+    """
+    async def run():
+        transports = {}
+        for gql, _ in items:
+            if hasattr(gql.client, "get_auth_token") and id(gql.client) not in transports:
+                transports[id(gql.client)] = AsyncTransport(gql.client, concurrency)
+            gql.set_transport(transports.get(id(gql.client)))
+        try:
+            return await asyncio.gather(*[gql.execute_async(variables) for gql, variables in items])
+        finally:
+            for t in transports.values():
+                await t.aclose()
+    return asyncio.run(run())
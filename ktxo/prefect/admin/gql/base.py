@@ -1,12 +1,23 @@
-import datetime
-import jmespath
-import prefect
-from typing import Dict, List, Union
-from tabulate import tabulate
+from typing import Dict, Iterator, List, Union
+from ktxo.prefect.admin.gql import batch, extract, output, schema as gql_schema, table
+from ktxo.prefect.admin.gql.client import check_errors, decode_response, get_client
+from ktxo.prefect.admin.gql.profile import profiler
 
 class GQLBase():
     DATE_TIME_FIELDS = ["created", "updated", "last_queried", "deleted_at", "start_time", "end_time", "scheduled_start_time"]
-    def __init__(self, gql_string:str, object:str, fields:List, cols:List=None):
+    DEFAULT_PAGE_SIZE = 100
+    # Seconds a result can be reused from the response cache, None: never cached
+    CACHE_TTL = None
+    def __init__(self, gql_string:str, object:str, fields:List=None, cols:List=None, paged:bool=False, watermark:str=None,
+                 schema:List[gql_schema.Column]=None):
+        """
+        schema: columns (see schema.Column), replaces fields/cols. gql_string contains '{selection}', replaced
+               by the selection set of the columns shown (see set_columns)
+        paged: gql_string declares '$limit:Int' and '$offset:Int' (with a stable 'order_by') and
+               results are fetched page by page, see pages()
+        watermark: field that increases when a row is created or changed (Ex: 'updated'), allows watch mode.
+               gql_string filters '{<watermark>: {_gte: $watermark}}' or the class overrides watermark_variables()
+        """
         self.gql_string = gql_string
         self.object = object
         self.fields = fields
@@ -16,41 +27,353 @@ class GQLBase():
                 self.cols = [c.upper() for c in fields]
         else:
             self.cols = cols
+        self.date_fields = GQLBase.DATE_TIME_FIELDS
         self.variables = {}
-        self.client = prefect.client.Client()
-        self.values = {}
+        self._client = None
+        self.paged = paged
+        self.watermark = watermark
+        self.schema = schema
+        self.query_template = gql_string
+        self._nest = {}
+        if schema is not None:
+            self.set_columns()
+        self.page_size = GQLBase.DEFAULT_PAGE_SIZE
+        self.max_rows = None
+        self.batch_size = batch.DEFAULT_BATCH_SIZE
+        self.workers = batch.DEFAULT_WORKERS
+        self.cache = None
+        self.sample_rows = output.DEFAULT_SAMPLE_ROWS
+        self.transport = None
+        self.raw = True
+        self.view_filters = []
+        self.view_sort = None
+        self.view_group_by = None
+        self._values = {}
+        self._pending = False
+
+    @property
+    def client(self):
+        # Shared client (see set_client), created on first request
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def set_client(self, client):
+        self.client = client
+        return self
+
+    @property
+    def values(self):
+        # Paged queries are fetched on first access, pages() avoids keeping all rows in memory
+        if self._pending:
+            self._values = [v for page in self.pages() for v in page]
+        return self._values
+
+    @values.setter
+    def values(self, values):
+        self._values = values
+        self._pending = False
+
+    def set_paging(self, page_size:int=None, max_rows:int=None):
+        if page_size:
+            self.page_size = page_size
+        self.max_rows = max_rows
+        return self
+
+    def set_batch(self, batch_size:int=None, workers:int=None):
+        if batch_size:
+            self.batch_size = batch_size
+        if workers:
+            self.workers = workers
+        return self
+
+    def set_cache(self, cache):
+        self.cache = cache
+        return self
+
+    def set_transport(self, transport):
+        """Transport used by execute_async() (see aio.AsyncTransport), None: request() on a thread"""
+        self.transport = transport
+        return self
+
+    def set_raw(self, raw:bool=True):
+        """raw: parse response bodies directly (orjson when installed) instead of prefect's GraphQLResult (Box)"""
+        self.raw = raw
+        return self
+
+    def set_view(self, filters:List[str]=None, sort:str=None, group_by:str=None):
+        """
+        Filter, sort and/or group the results in memory before printing (see table.ResultTable)
+        filters: ['COL=VALUE', 'COL>VALUE', ...], sort: 'COL[:desc],...', group_by: COL
+        """
+        self.view_filters = filters or []
+        self.view_sort = sort
+        self.view_group_by = group_by
+        # Columns of classes that set them on execute() are checked when printing
+        if self.cols is not None:
+            self.check_view()
+        return self
+
+    def check_view(self):
+        """Raise ValueError if set_view() uses columns that aren't in the results"""
+        names = [table.parse_filter(f)[0] for f in self.view_filters] + ([self.view_group_by] if self.view_group_by else [])
+        for name in names:
+            table.ResultTable(self.cols or []).position(name)
+        for name, _ in table.parse_sort(self.view_sort or ""):
+            table.ResultTable([self.view_group_by, "ROWS"] if self.view_group_by else self.cols or []).position(name)
+        return self
+
+    def set_columns(self, names:List[str]=None):
+        """
+        Show only columns 'names' (column name or field path), all when None.
+        With a schema only the fields needed are requested, otherwise the columns are selected from the results
+        """
+        if self.schema is not None:
+            columns = self.schema if names is None else gql_schema.select(self.schema, names)
+            extra = [f for f in [self.watermark and "id", self.watermark] if f]
+            selection, self._nest = gql_schema.selection_set(columns, extra)
+            self.gql_string = self.query_template.replace("{selection}", selection)
+            self.fields = [c.path for c in columns]
+            self.cols = [c.name for c in columns]
+            self.date_fields = [c.path for c in columns if c.type == "date"]
+        elif names is not None:
+            if self.fields is None or type(self).build_table is not GQLBase.build_table:
+                raise ValueError(f"Columns cannot be selected for '{self.object}'")
+            positions = {}
+            for i, (field, col) in enumerate(zip(self.fields, self.cols)):
+                positions.setdefault(col.upper(), i)
+                positions.setdefault(field, i)
+            unknown = [n for n in names if n.strip().upper() not in positions and n.strip() not in positions]
+            if unknown:
+                raise ValueError(f"Unknown column '{unknown[0]}', valid: {','.join(self.cols)}")
+            selected = [positions.get(n.strip().upper(), positions.get(n.strip())) for n in names]
+            self.fields = [self.fields[i] for i in selected]
+            self.cols = [self.cols[i] for i in selected]
+        return self
 
     def format_date(self,d:str):
-        return datetime.datetime.strptime(d, '%Y-%m-%dT%H:%M:%S.%f%z').astimezone().strftime('%Y-%m-%d_%H:%M:%S')
-
-    def build_table(self):
-        table = []
-        for v in self.values:
-            value = []
-            for r in self.fields:
-                elem = jmespath.search(r, v)
-                if isinstance(elem, dict):
-                    v_ = ",".join(elem) if isinstance(elem, list) else elem
-                else:
-                    v_ = elem
-                if r in GQLBase.DATE_TIME_FIELDS and v_ is not None:
-                    value.append(self.format_date(v_))
-                else:
-                    value.append(v_)
-            table.append(value)
-        return table
+        return extract.format_date(d)
+
+    def extraction_plan(self):
+        return extract.compile_fields(self.fields, self.date_fields)
+
+    def build_table(self, values:List=None):
+        plan = self.extraction_plan()
+        return [[get(v) for get in plan] for v in (self.values if values is None else values)]
+
+    def request(self, gql_string:str, variables:Union[dict,str]={}, raise_on_error:bool=True) -> dict:
+        """Send gql_string, return the response as dict {"data": ..., "errors": ...}"""
+        raw = self.raw and hasattr(self.client, "post_graphql")
+        with profiler.span("request", object=self.object):
+            if raw:
+                content = self.client.post_graphql(gql_string, variables)
+            else:
+                result = self.client.graphql(gql_string, variables=variables, raise_on_error=raise_on_error)
+        with profiler.span("decode", object=self.object):
+            return decode_response(content, raise_on_error) if raw else result.to_dict()
+
+    def fetch(self, variables:Union[dict,str]={}):
+        if self.cache is None or self.CACHE_TTL is None:
+            value = (self.request(self.gql_string, variables).get("data") or {}).get(self.object)
+        else:
+            key = self.cache.key(self.cache.scope(self.client), self.gql_string, variables)
+            hit, value = self.cache.get(self.object, key, self.CACHE_TTL)
+            profiler.count("cache_hits" if hit else "cache_misses")
+            if not hit:
+                value = (self.request(self.gql_string, variables).get("data") or {}).get(self.object)
+                self.cache.put(self.object, key, value)
+        return gql_schema.unnest(value, self._nest) if self._nest and isinstance(value, list) else value
 
     def execute(self, variables:Union[dict,str]={}):
         self.variables = variables
-        self.values = self.client.graphql(self.gql_string, variables=self.variables).data.to_dict().get(self.object)
+        if self.paged:
+            self._values = []
+            self._pending = True
+        else:
+            self.values = self.fetch(self.variables)
         return self
 
+    async def request_async(self, gql_string:str, variables:Union[dict,str]={}, raise_on_error:bool=True) -> dict:
+        if self.transport is None:
+            import asyncio
+            return await asyncio.get_running_loop().run_in_executor(None, lambda: self.request(gql_string, variables, raise_on_error))
+        with profiler.span("request", object=self.object):
+            result = await self.transport.post(gql_string, variables)
+        return check_errors(result, raise_on_error)
+
+    async def fetch_async(self, variables:Union[dict,str]={}):
+        if self.cache is None or self.CACHE_TTL is None:
+            value = ((await self.request_async(self.gql_string, variables)).get("data") or {}).get(self.object)
+        else:
+            key = self.cache.key(self.cache.scope(self.client), self.gql_string, variables)
+            hit, value = self.cache.get(self.object, key, self.CACHE_TTL)
+            profiler.count("cache_hits" if hit else "cache_misses")
+            if not hit:
+                value = ((await self.request_async(self.gql_string, variables)).get("data") or {}).get(self.object)
+                self.cache.put(self.object, key, value)
+        return gql_schema.unnest(value, self._nest) if self._nest and isinstance(value, list) else value
+
+    async def execute_async(self, variables:Union[dict,str]={}):
+        """
+        execute() on an event loop, several GQL classes can run concurrently (see aio.execute_all).
+        Paged queries are fetched completely, classes overriding execute() or pages() run them on a thread
+        """
+        if type(self).execute is not GQLBase.execute or type(self).pages is not GQLBase.pages:
+            def execute():
+                self.execute(variables)
+                self.values = self.values
+                return self
+            import asyncio
+            return await asyncio.get_running_loop().run_in_executor(None, execute)
+        self.variables = variables
+        if not self.paged:
+            self.values = await self.fetch_async(self.variables)
+            return self
+        values = []
+        while self.max_rows is None or len(values) < self.max_rows:
+            limit = self.page_size if self.max_rows is None else min(self.page_size, self.max_rows - len(values))
+            page = await self.fetch_async({**self.variables, "limit": limit, "offset": len(values)}) or []
+            values += page
+            if len(page) < limit:
+                break
+        self.values = values
+        return self
+
+    def watermark_variables(self, variables:dict, watermark:str) -> dict:
+        """Variables to get rows with watermark >= 'watermark'"""
+        return {**variables, "watermark": watermark}
+
+    def pages(self) -> Iterator[List]:
+        """Yield results page by page ('limit'/'offset'), stops on a short page or after max_rows"""
+        if not self._pending:
+            yield self.values
+            return
+        self._pending = False
+        offset = 0
+        while self.max_rows is None or offset < self.max_rows:
+            limit = self.page_size if self.max_rows is None else min(self.page_size, self.max_rows - offset)
+            page = self.fetch({**self.variables, "limit": limit, "offset": offset}) or []
+            if len(page) > 0:
+                yield page
+            offset += len(page)
+            if len(page) < limit:
+                break
+
+    def result(self) -> table.ResultTable:
+        """Results as columns, pages are extracted as they are fetched (they aren't kept)"""
+        def build_table(page):
+            profiler.count("rows", len(page or []))
+            with profiler.span("extract", object=self.object):
+                return self.build_table(page or [])
+        return table.ResultTable.from_pages(self.cols, (build_table(page) for page in self.pages()))
+
+    def view(self) -> table.ResultTable:
+        """result() with set_view() applied"""
+        result = self.result()
+        for f in self.view_filters:
+            result.filter(f)
+        if self.view_group_by:
+            result = result.group_by(self.view_group_by)
+        if self.view_sort:
+            result.sort(self.view_sort)
+        return result
+
     def print_table(self, data):
+        from tabulate import tabulate
         print(tabulate(data, headers=self.cols, showindex=True))
 
+    def set_output(self, sample_rows:int=None):
+        if sample_rows is not None:
+            self.sample_rows = sample_rows
+        return self
+
     def print(self, out='text'):
-        if out == "json":
-            print(self.values)
-        else:
-            data = self.build_table()
-            self.print_table(data)
+        """Write results page by page with the writer for 'out' (see output.FORMATS)"""
+        if self.view_filters or self.view_sort or self.view_group_by:
+            return self.print_view(out)
+        def build_table(page):
+            with profiler.span("extract", object=self.object):
+                return self.build_table(page)
+        writer = output.get_writer(out, self.cols, sample_rows=self.sample_rows)
+        for page in self.pages():
+            profiler.count("rows", len(page or []))
+            with profiler.span("render", object=self.object):
+                writer.write_page(page or [], build_table)
+        with profiler.span("render", object=self.object):
+            writer.close()
+
+    def print_view(self, out='text'):
+        """print() of view(), json/ndjson rows are written as {COL: value}"""
+        self.check_view()
+        result = self.view()
+        writer = output.get_writer(out, result.cols, sample_rows=self.sample_rows)
+        with profiler.span("render", object=self.object):
+            for rows in result.iter_rows():
+                writer.write_page(rows if writer.TABLE else [dict(zip(result.cols, r)) for r in rows], lambda rows: rows)
+            writer.close()
+
+
+class GQLMutation(GQLBase):
+    """
+    Mutation '<object>(input:{...}){success}' that can also be sent in bulk, see execute_many()
+    inputs: input name -> GraphQL type, the first one identifies each item in the report
+    """
+    # Objects whose cached results are removed after the mutation
+    INVALIDATES = []
+    def __init__(self, object:str, inputs:Dict[str,str]):
+        self.inputs = inputs
+        self.template = f"{object}(input:{{{', '.join(f'{k}: ${k}' for k in inputs)}}}){{success}}"
+        super().__init__(
+            gql_string=f"mutation F({', '.join(f'${k}:{t}' for k, t in inputs.items())}){{\n    {self.template}\n}}",
+            object=object,
+            fields=None,
+            cols=["ID", "SUCCESS", "ERROR"])
+
+    def invalidate(self):
+        if self.cache is not None and len(self.INVALIDATES) > 0:
+            self.cache.invalidate(self.INVALIDATES)
+
+    def execute(self, variables:Union[dict,str]={}):
+        try:
+            return super().execute(variables)
+        finally:
+            self.invalidate()
+
+    def execute_many(self, items:List[Dict]):
+        """Send items in aliased documents of 'batch_size' mutations, values = [[id, success, error], ...]"""
+        try:
+            results = batch.run_concurrently(self.execute_batch, list(batch.chunks(items, self.batch_size)), self.workers)
+        finally:
+            self.invalidate()
+        self.values = [row for rows in results for row in rows]
+        return self
+
+    def execute_batch(self, items:List[Dict]):
+        key = next(iter(self.inputs))
+        gql_string, variables = batch.aliased_document("mutation", self.template, self.inputs, items)
+        try:
+            result = self.request(gql_string, variables, raise_on_error=False)
+        except Exception as e:
+            return [[item.get(key), False, str(e)] for item in items]
+        data = result.get("data") or {}
+        # Errors are reported by alias in 'path', an error without path applies to the whole document
+        errors = {}
+        for e in result.get("errors") or []:
+            errors[(e.get("path") or [None])[0]] = e.get("message")
+        rows = []
+        for i, item in enumerate(items):
+            alias = f"{batch.ALIAS}{i}"
+            error = errors.get(alias, errors.get(None))
+            success = error is None and bool((data.get(alias) or {}).get("success"))
+            rows.append([item.get(key), success, error])
+        return rows
+
+    def failed(self) -> List:
+        return [row[0] for row in self.values if not row[1]]
+
+    def build_table(self, values:List=None):
+        return list(self.values if values is None else values)
@@ -0,0 +1,38 @@
+import re
+from typing import Callable, Dict, Iterator, List, Tuple
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_WORKERS = 4
+ALIAS = "a"
+
+def chunks(items:List, size:int) -> Iterator[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def aliased_document(operation:str, template:str, types:Dict[str,str], items:List[Dict]) -> Tuple[str, Dict]:
+    """
+    Build one GraphQL document with an aliased copy of 'template' for each item
+    Ex: template="secret_value(name:$secret_name)", types={"secret_name": "String"}, 2 items:
+        query F($secret_name_0:String,$secret_name_1:String){
+          a0: secret_value(name:$secret_name_0)
+          a1: secret_value(name:$secret_name_1)}
+    Result for item i is in data[f"{ALIAS}{i}"]
+    """
+    declarations = []
+    selections = []
+    variables = {}
+    for i, item in enumerate(items):
+        for name, type_ in types.items():
+            declarations.append(f"${name}_{i}:{type_}")
+            variables[f"{name}_{i}"] = item.get(name)
+        selections.append(f"  {ALIAS}{i}: " + re.sub(r"\$(\w+)", lambda m: f"${m.group(1)}_{i}", template))
+    document = f"{operation} F({','.join(declarations)}){{\n" + "\n".join(selections) + "}"
+    return document, variables
+
+def run_concurrently(fn:Callable, items:List, workers:int=DEFAULT_WORKERS) -> List:
+    """Apply fn to items on a bounded pool of threads, results keep items order"""
+    if len(items) <= 1 or workers <= 1:
+        return [fn(i) for i in items]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(fn, items))
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, List, Tuple
+
+_log = logging.getLogger("ktxo.prefect.admin")
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "prefect_wrapper")
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+class ResponseCache():
+    """
+    On disk cache for query results, one file '<object>-<key>.json' per entry
+    - key: hash of scope (server, tenant, credentials) + gql_string + variables (sorted keys)
+    - ttl: given by each GQL class on get() (CACHE_TTL)
+    - LRU: file mtime is the last use, oldest entries are removed above max_entries/max_bytes
+    - refresh: ignore cached entries but store new results
+    """
+    def __init__(self, path:str=DEFAULT_DIR, max_entries:int=DEFAULT_MAX_ENTRIES, max_bytes:int=DEFAULT_MAX_BYTES, refresh:bool=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def scope(client) -> list:
+        """Server, tenant id and a hash of the API key/token: a cached entry is only seen by the same credentials"""
+        secret = getattr(client, "api_key", None) or getattr(client, "_api_token", None)
+        return [getattr(client, "api_server", None), getattr(client, "_tenant_id", None),
+                hashlib.sha256(secret.encode("utf-8")).hexdigest() if secret else None]
+
+    @staticmethod
+    def key(server:Any, gql_string:str, variables:Any) -> str:
+        text = json.dumps([server, " ".join(gql_string.split()), variables], sort_keys=True, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _file(self, object:str, key:str) -> str:
+        return os.path.join(self.path, f"{object}-{key}.json")
+
+    def get(self, object:str, key:str, ttl:int) -> Tuple[bool, Any]:
+        """Return (hit, value)"""
+        file = self._file(object, key)
+        if self.refresh or not os.path.exists(file):
+            return False, None
+        try:
+            if time.time() - os.path.getmtime(file) > ttl:
+                return False, None
+            with open(file, "r", encoding="utf-8") as fd:
+                entry = json.load(fd)
+            if time.time() - entry["created"] > ttl:
+                return False, None
+            os.utime(file)
+            _log.debug(f"Cache hit {os.path.basename(file)}")
+            return True, entry["value"]
+        except (OSError, ValueError, KeyError) as e:
+            _log.debug(f"Cache read error {file}, {str(e)}")
+            return False, None
+
+    def put(self, object:str, key:str, value:Any):
+        file = self._file(object, key)
+        tmp = f"{file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fd:
+                json.dump({"created": time.time(), "value": value}, fd)
+            os.replace(tmp, file)
+        except (OSError, TypeError) as e:
+            _log.debug(f"Cache write error {file}, {str(e)}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self.evict()
+
+    def invalidate(self, objects:List[str]):
+        """Remove cached entries for objects, used after mutations"""
+        prefixes = tuple(f"{o}-" for o in objects)
+        for name in os.listdir(self.path):
+            if name.startswith(prefixes):
+                self._remove(os.path.join(self.path, name))
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".json"):
+                try:
+                    st = os.stat(os.path.join(self.path, name))
+                    entries.append((st.st_mtime, st.st_size, name))
+                except OSError:
+                    pass
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, name = entries.pop(0)
+            self._remove(os.path.join(self.path, name))
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            self._remove(os.path.join(self.path, name))
+
+    def _remove(self, file:str):
+        try:
+            os.remove(file)
+        except OSError:
+            pass
@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from ktxo.prefect.admin.gql.profile import profiler
+
+_clients = {}
+_locks = {}
+_lock = threading.Lock()
+_PooledClient = None
+
+def _pooled_client_class():
+    """Build the class on first use, 'prefect' and 'requests' are imported only when a client is needed"""
+    global _PooledClient
+    if _PooledClient is not None:
+        return _PooledClient
+    import prefect
+    import requests
+
+    class PooledClient(prefect.Client):
+        """
+        prefect.Client that keeps one HTTP session per thread (keep-alive) instead of
+        the new session (and TLS handshake) prefect.Client creates on each request
+        """
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._local = threading.local()
+
+        @property
+        def session(self) -> requests.Session:
+            session = getattr(self._local, "session", None)
+            if session is None:
+                # Same retry policy as prefect.Client._request
+                retries = requests.packages.urllib3.util.retry.Retry(
+                    total=6 if prefect.config.backend == "cloud" else 1,
+                    backoff_factor=1,
+                    status_forcelist=[500, 502, 503, 504],
+                    allowed_methods=["DELETE", "GET", "POST"])
+                session = requests.Session()
+                session.mount("https://", requests.adapters.HTTPAdapter(max_retries=retries))
+                self._local.session = session
+            return session
+
+        def _send_request(self, session, method, url, params=None, headers=None, rate_limit_counter=1):
+            response = super()._send_request(self.session, method, url, params, headers, rate_limit_counter)
+            # Rate limited requests are sent again calling _send_request, counted once by the first call
+            if rate_limit_counter == 1:
+                profiler.count("requests")
+                profiler.count("response_bytes", len(response.content))
+            return response
+
+        def post_graphql(self, query:str, variables=None) -> bytes:
+            """Send query, return the response body as is (graphql() wraps it in GraphQLResult, see decode_response)"""
+            if not isinstance(variables, str):
+                variables = json.dumps(variables or {})
+            params = {"query": query, "variables": variables}
+            response = self._send_request(self.session, "POST", self.api_server, params=params, headers=request_headers(self))
+            # Same retries as prefect.Client._request when the API answers API_ERROR
+            retry_count = 0
+            while retry_count < 6 and api_error(response.content):
+                if retry_count > 0:
+                    time.sleep(0.25 * (2 ** (retry_count - 1)))
+                retry_count += 1
+                response = self._send_request(self.session, "POST", self.api_server, params=params, headers=request_headers(self))
+            return response.content
+
+    _PooledClient = PooledClient
+    return _PooledClient
+
+def get_client(**kwargs):
+    """Process wide client, one per distinct kwargs (see prefect.Client, Ex: api_server, api_key)"""
+    key = tuple(sorted(kwargs.items()))
+    with _lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    # Creating a client can make requests (Ex: tenant of an API key), clients for other kwargs don't wait
+    with lock:
+        if key not in _clients:
+            with profiler.span("client_init"):
+                _clients[key] = _pooled_client_class()(**kwargs)
+        return _clients[key]
+
+def request_headers(client) -> dict:
+    """Headers prefect.Client sends with each request (auth, tenant, version), for requests made without it"""
+    import prefect
+    headers = {"Content-Type": "application/json", "X-PREFECT-CORE-VERSION": str(prefect.__version__)}
+    token = client.get_auth_token()
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    if client.api_key and client._tenant_id:
+        headers["X-PREFECT-TENANT-ID"] = client._tenant_id
+    headers.update(client._attached_headers or {})
+    return headers
+
+def loads(content:bytes):
+    """Parse JSON with orjson when it's installed"""
+    try:
+        import orjson
+    except ImportError:
+        return json.loads(content)
+    return orjson.loads(content)
+
+def api_error(content:bytes) -> bool:
+    """Response with error code API_ERROR (transient, prefect.Client retries the request)"""
+    if b"API_ERROR" not in content:
+        return False
+    try:
+        result = loads(content)
+    except ValueError:
+        return False
+    return isinstance(result, dict) and "API_ERROR" in str(result.get("errors"))
+
+def check_errors(result:dict, raise_on_error:bool=True) -> dict:
+    """Raise the exception prefect.Client.graphql() raises for the GraphQL 'errors' in result"""
+    if raise_on_error and result.get("errors"):
+        from prefect.exceptions import AuthorizationError, ClientError
+        errors = result["errors"]
+        if "UNAUTHENTICATED" in str(errors) or "Malformed Authorization header" in str(errors):
+            raise AuthorizationError(errors)
+        raise ClientError(errors)
+    return result
+
+def decode_response(content:bytes, raise_on_error:bool=True) -> dict:
+    """Response body to {"data": ..., "errors": ...} (plain dicts/lists)"""
+    if not content:
+        return {}
+    try:
+        result = loads(content)
+    except ValueError as e:
+        from prefect.exceptions import ClientError
+        raise ClientError("Malformed response received from API.") from e
+    return check_errors(result, raise_on_error)
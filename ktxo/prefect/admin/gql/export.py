@@ -0,0 +1,139 @@
+"""
+Log export as gzip NDJSON, for runs with too many log lines for one query
+- the time range (or the flow runs) is split in shards fetched in parallel, each one with keyset
+  pagination (see GQLLogExport) into its own gzip member (part file), only one page per worker is in memory
+- shards are appended to the output in order as they complete. A file made of several gzip members
+  reads as one stream (zcat, gzip -dc, Python gzip)
+- the state file keeps the shards (computed once, 'since 1d' doesn't move) and the output size after each
+  shard appended, an interrupted export run again with the same arguments continues after the last one
+"""
+import copy
+import datetime
+import gzip
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from ktxo.prefect.admin.gql import batch, output, stats
+from ktxo.prefect.admin.gql.profile import profiler
+
+_log = logging.getLogger("ktxo.prefect.admin")
+
+DEFAULT_SHARD = "1h"
+
+class Shard():
+    def __init__(self, key:str, where:dict):
+        self.key = key
+        self.where = where
+
+def time_shards(since:str, until:str, size:float, where:dict=None) -> List[Shard]:
+    """Shards [start, start + size) from since to until (ISO timestamps)"""
+    start = datetime.datetime.fromisoformat(since)
+    end = datetime.datetime.fromisoformat(until)
+    shards = []
+    while start < end:
+        stop = min(start + datetime.timedelta(seconds=size), end)
+        condition = {"timestamp": {"_gte": start.isoformat(), "_lt": stop.isoformat()}}
+        shards.append(Shard(start.isoformat(), {"_and": [where, condition]} if where else condition))
+        start = stop
+    return shards
+
+def flow_run_shards(flow_run_ids:List[str], since:str=None, until:str=None) -> List[Shard]:
+    """One shard per flow run"""
+    timestamp = {k: v for k, v in [("_gte", since), ("_lt", until)] if v}
+    return [Shard(i, {"flow_run_id": {"_eq": i}, **({"timestamp": timestamp} if timestamp else {})}) for i in flow_run_ids]
+
+def shards_for(since:str=None, until:str=None, flow_run_ids:List[str]=None, shard:str=DEFAULT_SHARD) -> List[Shard]:
+    """since/until: ISO timestamp or duration before now (see stats.parse_time), since: 1d without flow runs"""
+    since = stats.parse_time(since) if since else None
+    until = stats.parse_time(until) if until else None
+    if flow_run_ids:
+        return flow_run_shards(flow_run_ids, since, until)
+    return time_shards(since or stats.parse_time("1d"), until or datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                       stats.parse_duration(shard))
+
+
+class LogExport():
+    def __init__(self, gql, path:str, request:dict, workers:int=batch.DEFAULT_WORKERS, state_path:str=None):
+        """
+        gql: GQLLogExport (with client and paging set), copied for each shard
+        request: arguments of shards_for() as received
+        """
+        self.gql = gql
+        self.path = path
+        self.request = request
+        self.shards = []
+        self.workers = workers
+        self.state_path = state_path or f"{path}.state"
+        self.parts = f"{path}.parts"
+
+    def load_state(self) -> List[dict]:
+        """Set the shards, return the ones already appended ([] for a new export)"""
+        if not os.path.exists(self.state_path):
+            self.shards = shards_for(**self.request)
+            return []
+        with open(self.state_path, "r") as fd:
+            state = json.load(fd)
+        if state.get("request") != self.request or state.get("gql") != self.gql.gql_string:
+            raise ValueError(f"State file '{self.state_path}' is from another export, remove it to start again")
+        self.shards = [Shard(key, where) for key, where in state["shards"]]
+        done = state.get("done", [])
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < (done[-1]["offset"] if done else 0):
+            raise ValueError(f"'{self.path}' is shorter than in state file '{self.state_path}', remove it to start again")
+        return done
+
+    def save_state(self, done:List[dict]):
+        state = {"request": self.request, "gql": self.gql.gql_string, "shards": [[s.key, s.where] for s in self.shards], "done": done}
+        with open(self.state_path + ".tmp", "w") as fd:
+            json.dump(state, fd)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def fetch_shard(self, n:int) -> Tuple[str, int]:
+        """Write shard n into its part file, return (path, rows)"""
+        shard = self.shards[n]
+        part = os.path.join(self.parts, f"{n}.gz")
+        gql = copy.copy(self.gql)
+        rows = 0
+        with profiler.span("export", shard=shard.key), gzip.open(part, "wb", compresslevel=6) as fd:
+            for page in gql.execute({"where": shard.where}).pages():
+                fd.write("".join(output.dumps(r) + "\n" for r in page).encode("utf-8"))
+                rows += len(page)
+        profiler.count("rows", rows)
+        return part, rows
+
+    def run(self) -> List:
+        """Export the shards not appended yet, return [shards, shards resumed, rows, bytes]"""
+        done = self.load_state()
+        if os.path.exists(self.parts):
+            shutil.rmtree(self.parts)
+        os.makedirs(self.parts)
+        todo = list(range(len(done), len(self.shards)))
+        if len(done) > 0:
+            _log.info(f"Resuming '{self.path}' after {len(done)} of {len(self.shards)} shards")
+        with open(self.path, "r+b" if len(done) > 0 else "wb") as out:
+            out.truncate(done[-1]["offset"] if done else 0)
+            out.seek(0, os.SEEK_END)
+            executor = ThreadPoolExecutor(max_workers=max(1, self.workers))
+            futures = []
+            try:
+                futures += [executor.submit(self.fetch_shard, n) for n in todo]
+                for n, future in zip(todo, futures):
+                    part, rows = future.result()
+                    with open(part, "rb") as fd:
+                        shutil.copyfileobj(fd, out)
+                    out.flush()
+                    os.fsync(out.fileno())
+                    os.remove(part)
+                    done.append({"key": self.shards[n].key, "rows": rows, "offset": out.tell()})
+                    self.save_state(done)
+                    _log.info(f"Shard {n + 1}/{len(self.shards)} {self.shards[n].key}: {rows} rows")
+            finally:
+                # Error or interrupted: shards not started are cancelled
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=False)
+        shutil.rmtree(self.parts, ignore_errors=True)
+        return [len(self.shards), len(self.shards) - len(todo), sum(d["rows"] for d in done), os.path.getsize(self.path)]
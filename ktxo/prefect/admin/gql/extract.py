@@ -0,0 +1,60 @@
+import datetime
+import functools
+import re
+from typing import Any, Callable, List
+
+_PLAIN_PATH = re.compile(r"[A-Za-z_]\w*(\.[A-Za-z_]\w*)*")
+_plans = {}
+
+@functools.lru_cache(maxsize=8192)
+def format_date(d:str) -> str:
+    """ISO timestamp from API to local time, repeated timestamps are memoized"""
+    try:
+        dt = datetime.datetime.fromisoformat(d)
+    except ValueError:
+        # fromisoformat before Python 3.11 doesn't accept 'Z' or any number of fraction digits
+        dt = datetime.datetime.strptime(d, '%Y-%m-%dT%H:%M:%S.%f%z')
+    return dt.astimezone().strftime('%Y-%m-%d_%H:%M:%S')
+
+def _path_getter(path:str) -> Callable[[Any], Any]:
+    keys = path.split(".")
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda v: v.get(key) if isinstance(v, dict) else None
+
+    def get(v):
+        for k in keys:
+            if not isinstance(v, dict):
+                return None
+            v = v.get(k)
+        return v
+    return get
+
+def _date_getter(getter:Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def get(v):
+        d = getter(v)
+        return None if d is None else format_date(d)
+    return get
+
+def compile_field(field:str, date_fields:List[str]) -> Callable[[Any], Any]:
+    """
+    Extraction function for a field: plain dotted paths ('a.b') are dict lookups,
+    other jmespath expressions are compiled once, date fields are converted to local time
+    """
+    if _PLAIN_PATH.fullmatch(field):
+        getter = _path_getter(field)
+    else:
+        import jmespath
+        getter = jmespath.compile(field).search
+    if field in date_fields:
+        getter = _date_getter(getter)
+    return getter
+
+def compile_fields(fields:List[str], date_fields:List[str]) -> List[Callable[[Any], Any]]:
+    """Extraction plan (one function per field), compiled once per list of fields"""
+    key = (tuple(fields), tuple(date_fields))
+    plan = _plans.get(key)
+    if plan is None:
+        plan = [compile_field(f, date_fields) for f in fields]
+        _plans[key] = plan
+    return plan
@@ -1,75 +1,101 @@
 
-from ktxo.prefect.admin.gql.base import GQLBase
+import datetime
+from array import array
+from ktxo.prefect.admin.gql.base import GQLBase, GQLMutation
+from ktxo.prefect.admin.gql import batch, stats
+from ktxo.prefect.admin.gql.schema import Column
 class GQLAgentList(GQLBase):
+    CACHE_TTL = 60
     def __init__(self):
         super().__init__(
-            gql_string="query {agents {id, core_version, name, type, created, updated, last_queried, labels }}",
+            gql_string="query {agents { {selection} }}",
             object="agents",
-            fields=["id", "core_version", "name", "type", "created", "updated", "last_queried", "labels"],
-            cols=["ID", "CORE_VER", "NAME", "TYPE", "CREATED", "UPDATED", "LAST_QUERIED", "LABELS"])
+            schema=[Column("id", "ID"),
+                    Column("core_version", "CORE_VER"),
+                    Column("name", "NAME"),
+                    Column("type", "TYPE"),
+                    Column("created", "CREATED", "date"),
+                    Column("updated", "UPDATED", "date"),
+                    Column("last_queried", "LAST_QUERIED", "date"),
+                    Column("labels", "LABELS")])
 
 class GQLProjectList(GQLBase):
+    CACHE_TTL = 300
     def __init__(self):
         super().__init__(
             gql_string="""query{
   project {
-  id,name, description,flows_aggregate(distinct_on:flow_group_id){aggregate{count}}
+  {selection}
 }}""",
             object="project",
-            fields=["id","name","description","flows_aggregate.aggregate.count"],
-            cols=["ID","NAME","DESCRIPTION","NUM_FLOWS"])
+            schema=[Column("id", "ID"),
+                    Column("name", "NAME"),
+                    Column("description", "DESCRIPTION"),
+                    Column("flows_aggregate.aggregate.count", "NUM_FLOWS", select="flows_aggregate(distinct_on:flow_group_id){aggregate{count}}")])
 
 
 class GQLFlowRunList(GQLBase):
     def __init__(self):
         super().__init__(
-            gql_string="""query F($flow_name:String){
-  flow_run(where:{flow:{name:{_eq:$flow_name}}}){
-  id,version,name, state,state_message,agent {id,name,},start_time,end_time,labels,run_config,scheduled_start_time
+            gql_string="""query F($flow_name:String,$watermark:timestamptz,$limit:Int,$offset:Int){
+  flow_run(where:{flow:{name:{_eq:$flow_name}},updated:{_gte:$watermark}},limit:$limit,offset:$offset,order_by:[{scheduled_start_time:desc},{id:asc}]){
+  {selection}
 }}""",
             object="flow_run",
-            fields=["id", "version", "name", "agent.id", "agent.name", "state", "state_message", "scheduled_start_time", "start_time", "end_time", "labels", "run_config.labels"],
-            cols=["ID", "VER", "NAME", "AGENT_ID", "AGENT", "STATE", "STATE_MESSAGE", "SCHEDULED_AT","START", "END", "LABEL", "RUN_CONFG_LABELS"])
+            schema=[Column("id", "ID"),
+                    Column("version", "VER"),
+                    Column("name", "NAME"),
+                    Column("agent.id", "AGENT_ID"),
+                    Column("agent.name", "AGENT"),
+                    Column("state", "STATE"),
+                    Column("state_message", "STATE_MESSAGE"),
+                    Column("scheduled_start_time", "SCHEDULED_AT", "date"),
+                    Column("start_time", "START", "date"),
+                    Column("end_time", "END", "date"),
+                    Column("labels", "LABEL"),
+                    Column("run_config.labels", "RUN_CONFG_LABELS", "json")],
+            paged=True,
+            watermark="updated")
 
 
-class GQLFlowScheduleEnable(GQLBase):
+class GQLFlowScheduleEnable(GQLMutation):
+    INVALIDATES = ["flow"]
     def __init__(self):
         super().__init__(
-            gql_string="""mutation F($flow_id:UUID){
-    set_schedule_active(input:{
-    flow_id: $flow_id
-    }){success
-}}""",
             object="set_schedule_active",
-            fields=None,
-            cols=None)
+            inputs={"flow_id": "UUID"})
 
-class GQLFlowScheduleDisable(GQLBase):
+class GQLFlowScheduleDisable(GQLMutation):
+    INVALIDATES = ["flow"]
     def __init__(self):
         super().__init__(
-            gql_string="""mutation F($flow_id:UUID){
-    set_schedule_inactive(input:{
-    flow_id: $flow_id
-    }){success
-}}""",
             object="set_schedule_inactive",
-            fields=None,
-            cols=None)
+            inputs={"flow_id": "UUID"})
 
 
 class GQLFlowList(GQLBase):
+    CACHE_TTL = 60
     def __init__(self):
         super().__init__(
-            gql_string="""query F($archived:Boolean){ 
-    flow (where:{archived:{_eq:$archived}},limit:100, order_by:{version:desc,created:asc,updated:desc}){
-    id,version,name,archived,created,updated,is_schedule_active,flow_group_id, run_config
+            gql_string="""query F($archived:Boolean,$limit:Int,$offset:Int){ 
+    flow (where:{archived:{_eq:$archived}},limit:$limit,offset:$offset, order_by:[{version:desc},{created:asc},{updated:desc},{id:asc}]){
+    {selection}
 }}""",
             object="flow",
-            fields=["version","archived","id","name","created","updated","is_schedule_active","flow_group_id", "run_config.labels"],
-            cols=["VER","ARCHIVED","ID","NAME","CREATED","UPDATED","SCHEDULED","GROUP_ID","LABELS"])
+            schema=[Column("version", "VER"),
+                    Column("archived", "ARCHIVED"),
+                    Column("id", "ID"),
+                    Column("name", "NAME"),
+                    Column("created", "CREATED", "date"),
+                    Column("updated", "UPDATED", "date"),
+                    Column("is_schedule_active", "SCHEDULED"),
+                    Column("flow_group_id", "GROUP_ID"),
+                    Column("run_config.labels", "LABELS", "json")],
+            paged=True)
 
 
 class GQLSecretList(GQLBase):
+    CACHE_TTL = 300
     def __init__(self):
         super().__init__(
             gql_string="query {secret_names}",
@@ -81,12 +107,8 @@ class GQLSecretList(GQLBase):
         super().execute()
         return self
 
-    def print(self,out="text"):
-        if out == "json":
-            print(self.values)
-        else:
-            data = [[d] for d in self.values]
-            self.print_table(data)
+    def build_table(self, values:list=None):
+        return [[d] for d in (self.values if values is None else values)]
 
 class GQLSecretQuery(GQLBase):
     def __init__(self):
@@ -99,45 +121,254 @@ class GQLSecretQuery(GQLBase):
     def execute(self, variables="all"):
         values = []
         if variables == "all":
-            #secrets = do_graphql(GQL_SECRET_LIST, "secret_names")
-            secrets = GQLSecretList().execute().values
-            for s in secrets:
-                super().execute({"secret_name": s})
-                values.append([s,self.values])
+            # One aliased document per 'batch_size' secrets instead of one request per secret
+            # Same client (target, snapshot), cache and limits as this query
+            secrets = GQLSecretList().set_client(self.client).set_cache(self.cache).set_paging(self.page_size, self.max_rows).execute().values
+            for rows in batch.run_concurrently(self.fetch_batch, list(batch.chunks(secrets, self.batch_size)), self.workers):
+                values.extend(rows)
         else:
             super().execute({"secret_name": variables})
             values = [[variables, self.values]]
         self.values = values
         return self
 
-    def print(self,out="text"):
-        if out == "json":
-            print(self.values)
-        else:
-            #data = self.build_table()
-            self.print_table(self.values)
+    def fetch_batch(self, secrets:list):
+        gql_string, variables = batch.aliased_document("query", "secret_value(name:$secret_name)",
+                                                       {"secret_name": "String"},
+                                                       [{"secret_name": s} for s in secrets])
+        data = self.request(gql_string, variables).get("data") or {}
+        return [[s, data.get(f"{batch.ALIAS}{i}")] for i, s in enumerate(secrets)]
+
+    def build_table(self, values:list=None):
+        return list(self.values if values is None else values)
 
 
 class GQLFlowQuery(GQLBase):
     def __init__(self):
         super().__init__(
-            gql_string="""query F($flow_name:String,$archived:Boolean){
-    flow (where: {name: {_eq: $flow_name},_and: {archived:{_eq:$archived}}},limit:100, order_by:{version:desc,created:asc,updated:desc}){
-    id,version,name,archived,,created,updated,is_schedule_active, flow_group_id, run_config,parameters,flow_group {default_parameters}
+            gql_string="""query F($flow_name:String,$archived:Boolean,$limit:Int,$offset:Int){
+    flow (where: {name: {_eq: $flow_name},_and: {archived:{_eq:$archived}}},limit:$limit,offset:$offset, order_by:[{version:desc},{created:asc},{updated:desc},{id:asc}]){
+    {selection}
 }}""",
             object="flow",
-            fields=["version","archived","id","name","created","updated","is_schedule_active","flow_group_id", "run_config.labels", "parameters[*][name,default,required]", "flow_group.default_parameters"],
-            cols=["VER","ARCHIVED","ID","NAME","CREATED","UPDATED","SCHEDULED","GROUP_ID","LABELS", "PARAMETERS(NAME,DFLT,REQ)","DEFAULT_PARAMETERS"])
+            schema=[Column("version", "VER"),
+                    Column("archived", "ARCHIVED"),
+                    Column("id", "ID"),
+                    Column("name", "NAME"),
+                    Column("created", "CREATED", "date"),
+                    Column("updated", "UPDATED", "date"),
+                    Column("is_schedule_active", "SCHEDULED"),
+                    Column("flow_group_id", "GROUP_ID"),
+                    Column("run_config.labels", "LABELS", "json"),
+                    Column("parameters[*][name,default,required]", "PARAMETERS(NAME,DFLT,REQ)", "json"),
+                    Column("flow_group.default_parameters", "DEFAULT_PARAMETERS")],
+            paged=True)
 
-class GQLSetParameter(GQLBase):
+class GQLSetParameter(GQLMutation):
+    INVALIDATES = ["flow", "flow_group"]
     def __init__(self):
         super().__init__(
-            gql_string="""mutation F($flow_group_id:UUID!, $parameters:JSON!){
-    set_flow_group_default_parameters(input:{
-    flow_group_id: $flow_group_id,
-    parameters: $parameters
-    }){success
-}}""",
             object="set_flow_group_default_parameters",
-            fields=None,
-            cols=None)
+            inputs={"flow_group_id": "UUID!", "parameters": "JSON!"})
+
+class GQLFlowGroupParameters(GQLBase):
+    def __init__(self):
+        super().__init__(
+            gql_string="""query F($flow_group_ids:[uuid!]){
+    flow_group (where: {id: {_in: $flow_group_ids}}){
+    id, default_parameters
+}}""",
+            object="flow_group",
+            fields=["id", "default_parameters"],
+            cols=["GROUP_ID", "DEFAULT_PARAMETERS"])
+
+    def plan(self, desired:dict):
+        """
+        Compare desired {flow_group_id: parameters} with current default parameters (one request for all groups)
+        Return rows [group_id, action, added, removed, changed], action is 'update', 'unchanged' or 'not found'
+        """
+        self.execute({"flow_group_ids": list(desired)})
+        current = {v["id"]: v.get("default_parameters") or {} for v in self.values}
+        plan = []
+        for group_id, parameters in desired.items():
+            if group_id not in current:
+                plan.append([group_id, "not found", None, None, None])
+                continue
+            old = current[group_id]
+            added = sorted(k for k in parameters if k not in old)
+            removed = sorted(k for k in old if k not in parameters)
+            changed = sorted(k for k in parameters if k in old and old[k] != parameters[k])
+            action = "update" if added or removed or changed else "unchanged"
+            plan.append([group_id, action, ",".join(added), ",".join(removed), ",".join(changed)])
+        self.values = plan
+        self.cols = ["GROUP_ID", "ACTION", "ADDED", "REMOVED", "CHANGED"]
+        return plan
+
+    def build_table(self, values:list=None):
+        return list(self.values if values is None else values)
+
+class GQLFlowRunStats(GQLBase):
+    """
+    Flow runs per group ('flow', 'state') counted by the server (flow_run_aggregate), run durations
+    (end_time - start_time) summarized locally over compact columns, see stats.group_stats.
+    With a bucket (seconds) rows are also split by scheduled time and counted locally
+    variables: {"since": ISO, "until": ISO, "flow_name": NAME}, all optional
+    """
+    GROUPS = {"flow": "flow_id", "state": "state"}
+    def __init__(self):
+        super().__init__(
+            gql_string="""query F($where:flow_run_bool_exp,$limit:Int,$offset:Int){
+  flow_run(where:$where,limit:$limit,offset:$offset,order_by:[{scheduled_start_time:asc},{id:asc}]){
+  flow_id, state, scheduled_start_time, start_time, end_time
+}}""",
+            object="flow_run",
+            paged=True)
+        self.group_by = ["flow", "state"]
+        self.bucket = None
+
+    def set_stats(self, group_by:list=None, bucket:float=None):
+        if group_by is not None:
+            self.group_by = group_by
+        self.bucket = bucket
+        return self
+
+    def where(self, variables:dict) -> dict:
+        where = {"scheduled_start_time": {"_gte": variables.get("since"), "_lt": variables.get("until")}}
+        if variables.get("flow_name"):
+            where["flow"] = {"name": {"_eq": variables["flow_name"]}}
+        return where
+
+    def groups(self, where:dict) -> list:
+        """Distinct values of the group columns (one request)"""
+        columns = [GQLFlowRunStats.GROUPS[g] for g in self.group_by]
+        if len(columns) == 0:
+            return [{}]
+        selection = ", ".join(columns + (["flow {name}"] if "flow" in self.group_by else []))
+        gql_string = f"query F($where:flow_run_bool_exp){{\n  flow_run(where:$where,distinct_on:[{','.join(columns)}]){{{selection}}}\n}}"
+        return (self.request(gql_string, {"where": where}).get("data") or {}).get("flow_run") or []
+
+    def labels(self, group:dict) -> tuple:
+        return tuple((group.get("flow") or {}).get("name") if g == "flow" else group.get("state") for g in self.group_by)
+
+    def count_batch(self, items:list) -> list:
+        gql_string, variables = batch.aliased_document("query", "flow_run_aggregate(where:{_and:[$where,$group]}){aggregate{count}}",
+                                                       {"where": "flow_run_bool_exp", "group": "flow_run_bool_exp"}, items)
+        data = self.request(gql_string, variables).get("data") or {}
+        return [((data.get(f"{batch.ALIAS}{i}") or {}).get("aggregate") or {}).get("count") or 0 for i in range(len(items))]
+
+    def execute(self, variables:dict={}):
+        where = self.where(variables)
+        groups = self.groups(where)
+        # Flow versions have their own flow_id, groups are by flow name
+        codes = {}
+        group_code = []
+        for g in groups:
+            group_code.append(codes.setdefault(self.labels(g), len(codes)))
+        flow_code = {}
+        for g, code in zip(groups, group_code):
+            flow_code[(g.get("flow_id"), g.get("state"))] = code
+        counts = [0] * len(codes)
+        if self.bucket is None:
+            columns = [GQLFlowRunStats.GROUPS[g] for g in self.group_by]
+            items = [{"where": where, "group": {c: {"_eq": g.get(c)} for c in columns}} for g in groups]
+            results = batch.run_concurrently(self.count_batch, list(batch.chunks(items, self.batch_size)), self.workers)
+            for code, count in zip(group_code, [c for r in results for c in r]):
+                counts[code] += count
+            # Durations only from finished runs
+            where = {"_and": [where, {"start_time": {"_is_null": False}}, {"end_time": {"_is_null": False}}]}
+
+        keys, times, durations = array("q"), array("d"), array("d")
+        by_flow = "flow" in self.group_by
+        by_state = "state" in self.group_by
+        super().execute({"where": where})
+        for page in self.pages():
+            for r in page:
+                code = flow_code.get((r.get("flow_id") if by_flow else None, r.get("state") if by_state else None))
+                if code is None:
+                    continue
+                keys.append(code)
+                times.append(stats.to_epoch(r.get("scheduled_start_time")))
+                durations.append(stats.to_epoch(r.get("end_time")) - stats.to_epoch(r.get("start_time")))
+
+        names = [g.upper() for g in self.group_by]
+        measures = ["RUNS", "FINISHED", "MEAN_S"] + [f"P{p}_S" for p in stats.PERCENTILES] + ["MAX_S"]
+        labels = list(codes)
+        rows = []
+        if self.bucket is None:
+            summary = stats.group_stats(keys, durations)
+            for code, label in enumerate(labels):
+                _, finished, mean, percentiles, max_ = summary.get(code, (0, 0, None, [None] * len(stats.PERCENTILES), None))
+                rows.append(list(label) + [counts[code], finished] + [self.seconds(v) for v in [mean] + percentiles + [max_]])
+            rows.sort(key=lambda r: tuple("" if v is None else v for v in r[:len(names)]))
+            self.cols = names + measures
+        else:
+            origin = stats.to_epoch(variables.get("since")) if variables.get("since") else min(times, default=0)
+            origin = origin // self.bucket * self.bucket
+            summary = stats.group_stats(stats.bucket_keys(times, keys, max(len(codes), 1), origin, self.bucket), durations)
+            for key, (runs, finished, mean, percentiles, max_) in summary.items():
+                bucket, code = divmod(key, max(len(codes), 1))
+                start = datetime.datetime.fromtimestamp(origin + bucket * self.bucket, datetime.timezone.utc).isoformat()
+                rows.append([start] + list(labels[code]) + [runs, finished] + [self.seconds(v) for v in [mean] + percentiles + [max_]])
+            rows.sort(key=lambda r: tuple("" if v is None else v for v in r[:len(names) + 1]))
+            rows = [[self.format_date(r[0])] + r[1:] for r in rows]
+            self.cols = ["BUCKET"] + names + measures
+        self.values = rows
+        return self
+
+    def seconds(self, value:float):
+        return None if value is None else round(value, 1)
+
+    def build_table(self, values:list=None):
+        return list(self.values if values is None else values)
+
+
+class GQLLogExport(GQLBase):
+    """
+    Logs matching variables["where"] in (timestamp, id) order. Pages use keyset pagination:
+    each page asks for rows after the last (timestamp, id) seen, so deep pages cost the same as the first
+    """
+    DEFAULT_PAGE_SIZE = 1000
+    def __init__(self):
+        super().__init__(
+            gql_string="""query F($where:log_bool_exp,$limit:Int){
+  log(where:$where,limit:$limit,order_by:[{timestamp:asc},{id:asc}]){
+  {selection}
+}}""",
+            object="log",
+            schema=[Column("timestamp", "TIMESTAMP", "date"),
+                    Column("flow_run_id", "FLOW_RUN_ID"),
+                    Column("task_run_id", "TASK_RUN_ID"),
+                    Column("level", "LEVEL"),
+                    Column("name", "NAME"),
+                    Column("message", "MESSAGE"),
+                    Column("id", "ID")],
+            paged=True,
+            watermark="timestamp")
+        self.page_size = GQLLogExport.DEFAULT_PAGE_SIZE
+
+    def watermark_variables(self, variables:dict, watermark:str) -> dict:
+        return {**variables, "where": self.after(variables.get("where"), {"timestamp": {"_gte": watermark}} if watermark else None)}
+
+    def after(self, where:dict, condition:dict) -> dict:
+        return {"_and": [where, condition]} if where and condition else where or condition
+
+    def pages(self):
+        if not self._pending:
+            yield self.values
+            return
+        self._pending = False
+        count = 0
+        cursor = None
+        while self.max_rows is None or count < self.max_rows:
+            limit = self.page_size if self.max_rows is None else min(self.page_size, self.max_rows - count)
+            where = self.variables.get("where")
+            if cursor is not None:
+                where = self.after(where, {"_or": [{"timestamp": {"_gt": cursor[0]}},
+                                                   {"timestamp": {"_eq": cursor[0]}, "id": {"_gt": cursor[1]}}]})
+            page = self.fetch({**self.variables, "where": where, "limit": limit}) or []
+            if len(page) > 0:
+                yield page
+                cursor = (page[-1]["timestamp"], page[-1]["id"])
+            count += len(page)
+            if len(page) < limit:
+                break
@@ -0,0 +1,124 @@
+"""
+Subset of GraphQL used by the GQL classes, to run them against local data (snapshot, benchmarks fake server):
+aliases, variables, field arguments (objects, lists, strings, numbers, enums) and selection sets
+"""
+import json
+import re
+from typing import List, Tuple
+
+class Field():
+    def __init__(self, name:str, alias:str=None, args:str="", selections:List["Field"]=None):
+        self.name = name
+        self.alias = alias or name
+        self.args = args
+        self.selections = selections
+
+def parse_document(document:str) -> Tuple[str, List[Field]]:
+    """Return (operation, root fields)"""
+    document = document.strip()
+    operation = "mutation" if document.startswith("mutation") else "query"
+    pos = document.index("{", _skip_parens(document, 0))
+    fields, _ = _parse_selections(document, pos + 1)
+    return operation, fields
+
+def _skip_parens(text:str, pos:int) -> int:
+    """Position after the operation variables '(...)' if any"""
+    brace = text.find("{", pos)
+    paren = text.find("(", pos)
+    if paren == -1 or paren > brace:
+        return pos
+    return _balanced(text, paren, "(", ")")
+
+def _balanced(text:str, pos:int, open_:str, close:str) -> int:
+    depth = 0
+    for i in range(pos, len(text)):
+        if text[i] == open_:
+            depth += 1
+        elif text[i] == close:
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    raise ValueError(f"Unbalanced '{open_}'")
+
+_NAME = re.compile(r"[\s,]*([A-Za-z_]\w*)\s*(:)?")
+
+def _parse_selections(text:str, pos:int) -> Tuple[List[Field], int]:
+    fields = []
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if text[pos] == "}":
+            return fields, pos + 1
+        m = _NAME.match(text, pos)
+        name, alias = m.group(1), None
+        pos = m.end()
+        if m.group(2):
+            alias = name
+            m = _NAME.match(text, pos)
+            name = m.group(1)
+            pos = m.end()
+        while pos < len(text) and text[pos] in " \t\r\n":
+            pos += 1
+        args = ""
+        if text[pos] == "(":
+            end = _balanced(text, pos, "(", ")")
+            args, pos = text[pos + 1:end - 1], end
+        while pos < len(text) and text[pos] in " \t\r\n":
+            pos += 1
+        selections = None
+        if text[pos] == "{":
+            selections, pos = _parse_selections(text, pos + 1)
+        fields.append(Field(name, alias, args, selections))
+
+def project(value, field:Field):
+    """Keep only the selected fields, jsonb 'path' argument returns a sub value"""
+    m = re.search(r'path\s*:\s*"([^"]*)"', field.args)
+    if m and value is not None:
+        for k in m.group(1).lstrip("$.").split("."):
+            value = value.get(k) if isinstance(value, dict) else None
+    if field.selections is None or value is None:
+        return value
+    if isinstance(value, list):
+        return [project(v, field) for v in value]
+    return {f.alias: project(value.get(f.name), f) for f in field.selections}
+
+_TOKEN = re.compile(r'\s*(?:(\$\w+)|("(?:[^"\\]|\\.)*")|(-?\d+(?:\.\d+)?)|([A-Za-z_]\w*)|([{}\[\]:,]))')
+
+def parse_arguments(args:str, variables:dict) -> dict:
+    """Field arguments 'a: 1, where: {x: {_eq: $v}}' as dict, variables replaced by their values"""
+    tokens = [t[4] or t for t in _TOKEN.findall(args)]
+    value, _ = _parse_value(["{"] + tokens + ["}"], 0, variables)
+    return value
+
+def _parse_value(tokens:list, i:int, variables:dict):
+    t = tokens[i]
+    if t == "{":
+        obj, i = {}, i + 1
+        while tokens[i] != "}":
+            if tokens[i] == ",":
+                i += 1
+                continue
+            key = _text(tokens[i])
+            value, i = _parse_value(tokens, i + 2, variables)
+            obj[key] = value
+        return obj, i + 1
+    if t == "[":
+        items, i = [], i + 1
+        while tokens[i] != "]":
+            if tokens[i] == ",":
+                i += 1
+                continue
+            value, i = _parse_value(tokens, i, variables)
+            items.append(value)
+        return items, i + 1
+    var, string, number, name, _ = t
+    if var:
+        return variables.get(var[1:]), i + 1
+    if string:
+        return json.loads(string), i + 1
+    if number:
+        return json.loads(number), i + 1
+    return {"true": True, "false": False, "null": None}.get(name, name), i + 1
+
+def _text(token) -> str:
+    return token if isinstance(token, str) else next(t for t in token if t).strip('"')
@@ -0,0 +1,195 @@
+"""
+Output writers, rows are written page by page as they are extracted
+- text: tabulate, column widths taken from the first 'sample_rows' rows (0: all rows)
+- json: JSON array of the objects returned by the API
+- ndjson: one object per line
+- csv, tsv: header + one line per row
+collect() keeps the rows written in the current thread instead (see targets)
+"""
+import contextlib
+import csv
+import json
+import sys
+import threading
+from typing import Any, Callable, List
+
+FORMATS = ["text", "json", "ndjson", "csv", "tsv"]
+DEFAULT_SAMPLE_ROWS = 1000
+_local = threading.local()
+
+_dumps = None
+
+def _load_dumps() -> Callable[[Any], str]:
+    global _dumps
+    try:
+        import orjson
+        _dumps = lambda obj: orjson.dumps(obj, default=str).decode("utf-8")
+    except ImportError:
+        _dumps = lambda obj: json.dumps(obj, default=str, ensure_ascii=False)
+    return _dumps
+
+def dumps(obj:Any) -> str:
+    """JSON text, orjson when it's installed (imported on first use, -v/--help don't load it)"""
+    return (_dumps or _load_dumps())(obj)
+
+
+def _isnumber(v:Any) -> bool:
+    if isinstance(v, bool):
+        return False
+    if isinstance(v, (int, float)):
+        return True
+    try:
+        float(v)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+class Writer():
+    # Writer needs table rows (build_table), otherwise objects from API
+    TABLE = True
+    def __init__(self, cols:List[str], stream=None):
+        self.cols = cols
+        self.stream = sys.stdout if stream is None else stream
+        self.count = 0
+
+    def write_page(self, page:List, build_table:Callable[[List], List]):
+        self.write(build_table(page) if self.TABLE else page)
+        self.count += len(page)
+
+    def write(self, rows:List):
+        raise NotImplementedError()
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+class TextWriter(Writer):
+    def __init__(self, cols:List[str], stream=None, sample_rows:int=DEFAULT_SAMPLE_ROWS):
+        super().__init__(cols, stream)
+        self.sample_rows = sample_rows
+        self.sample = []
+        self.widths = None
+        self.index = 0
+
+    def write(self, rows:List):
+        if self.widths is None:
+            self.sample.extend(rows)
+            if self.sample_rows and len(self.sample) >= self.sample_rows:
+                self.flush_sample()
+        else:
+            self.write_rows(rows)
+
+    def flush_sample(self):
+        from tabulate import tabulate
+        text = tabulate(self.sample, headers=self.cols or (), showindex=True)
+        self.stream.write(text + "\n")
+        # Separator line '--  -----  ...' gives the width of each column (index included)
+        lines = text.split("\n")
+        separator = lines[1] if self.cols and len(lines) > 1 else lines[0]
+        self.widths = [len(c) for c in separator.split("  ")]
+        # Right aligned columns, same rule as tabulate: all values in the sample are numbers
+        self.numeric = [len(values) > 0 and all(_isnumber(v) for v in values)
+                        for values in [[r[j] for r in self.sample if j < len(r) and r[j] is not None] for j in range(len(self.widths) - 1)]]
+        self.index = len(self.sample)
+        self.sample = []
+
+    def write_rows(self, rows:List):
+        lines = []
+        for row in rows:
+            cells = [str(self.index).rjust(self.widths[0])]
+            for v, w, numeric in zip(row, self.widths[1:], self.numeric):
+                if numeric:
+                    cells.append(("" if v is None else str(v)).rjust(w))
+                else:
+                    cells.append(("" if v is None else str(v)).ljust(w))
+            lines.append("  ".join(cells).rstrip() + "\n")
+            self.index += 1
+        self.stream.write("".join(lines))
+
+    def flush(self):
+        # Watch mode: don't wait for 'sample_rows' rows
+        if self.widths is None and len(self.sample) > 0:
+            self.flush_sample()
+        super().flush()
+
+    def close(self):
+        if self.widths is None:
+            self.flush_sample()
+        super().close()
+
+
+class JSONWriter(Writer):
+    TABLE = False
+    def write(self, rows:List):
+        if len(rows) == 0:
+            return
+        prefix = "[" if self.count == 0 else ",\n"
+        self.stream.write(prefix + ",\n".join(dumps(r) for r in rows))
+
+    def close(self):
+        self.stream.write("[]\n" if self.count == 0 else "]\n")
+        super().close()
+
+
+class NDJSONWriter(Writer):
+    TABLE = False
+    def write(self, rows:List):
+        self.stream.write("".join(dumps(r) + "\n" for r in rows))
+
+
+class CSVWriter(Writer):
+    def __init__(self, cols:List[str], stream=None, delimiter:str=","):
+        super().__init__(cols, stream)
+        self.writer = csv.writer(self.stream, delimiter=delimiter, lineterminator="\n")
+        if self.cols:
+            self.writer.writerow(self.cols)
+
+    def write(self, rows:List):
+        self.writer.writerows([[dumps(v) if isinstance(v, (list, dict)) else v for v in r] for r in rows])
+
+
+class CollectWriter(Writer):
+    """Keeps table rows in memory"""
+    def __init__(self, cols:List[str]):
+        super().__init__(cols)
+        self.rows = []
+
+    def write(self, rows:List):
+        self.rows.extend(rows)
+
+    def flush(self):
+        pass
+
+
+@contextlib.contextmanager
+def collect():
+    """Writers created in this thread keep their rows, yields the list of CollectWriter (one per table written)"""
+    _local.tables = []
+    try:
+        yield _local.tables
+    finally:
+        _local.tables = None
+
+
+def collecting() -> bool:
+    return getattr(_local, "tables", None) is not None
+
+
+def get_writer(out:str, cols:List[str], stream=None, sample_rows:int=DEFAULT_SAMPLE_ROWS) -> Writer:
+    tables = getattr(_local, "tables", None)
+    if tables is not None:
+        tables.append(CollectWriter(cols))
+        return tables[-1]
+    if out == "json":
+        return JSONWriter(cols, stream)
+    elif out == "ndjson":
+        return NDJSONWriter(cols, stream)
+    elif out == "csv":
+        return CSVWriter(cols, stream)
+    elif out == "tsv":
+        return CSVWriter(cols, stream, delimiter="\t")
+    return TextWriter(cols, stream, sample_rows)
@@ -0,0 +1,104 @@
+"""
+Hot path instrumentation, disabled unless profiler.enable() is called (--profile/--metrics-file)
+- span(name): timed phase (client_init, request, decode, extract, render, ...), spans can be nested
+- count(name, value): counters (requests, response_bytes, rows)
+Output: summary() for humans, trace_events() (Chrome/Perfetto trace event format), openmetrics()
+"""
+import contextlib
+import os
+import threading
+import time
+from typing import Dict, List
+
+_NULL = contextlib.nullcontext()
+
+class Profiler():
+    def __init__(self):
+        self.enabled = False
+        self.spans:List[dict] = []
+        self.counters:Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._t0 = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        return self
+
+    def span(self, name:str, **attrs):
+        return self._span(name, attrs) if self.enabled else _NULL
+
+    @contextlib.contextmanager
+    def _span(self, name:str, attrs:dict):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        record = {"name": name, "start": time.perf_counter(), "children": 0.0, "tid": threading.get_ident(), "args": attrs}
+        stack.append(record)
+        try:
+            yield record
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            self.add_span(name, record["start"], end, record["children"], record["tid"], attrs)
+            if stack:
+                stack[-1]["children"] += end - record["start"]
+
+    def add_span(self, name:str, start:float, end:float, children:float=0.0, tid:int=None, attrs:dict=None):
+        """Record a span measured elsewhere (Ex: imports before main)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.spans.append({"name": name, "start": start, "duration": end - start, "self": end - start - children,
+                               "tid": tid or threading.get_ident(), "args": attrs or {}})
+
+    def count(self, name:str, value:float=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def phases(self) -> Dict[str, dict]:
+        """Per span name: calls, total seconds (inclusive), self seconds (without nested spans), max seconds"""
+        phases = {}
+        for s in self.spans:
+            p = phases.setdefault(s["name"], {"calls": 0, "total": 0.0, "self": 0.0, "max": 0.0})
+            p["calls"] += 1
+            p["total"] += s["duration"]
+            p["self"] += s["self"]
+            p["max"] = max(p["max"], s["duration"])
+        return phases
+
+    def summary(self) -> str:
+        lines = [f"{'PHASE':<14} {'CALLS':>6} {'TOTAL_MS':>10} {'SELF_MS':>10} {'MAX_MS':>10}"]
+        for name, p in self.phases().items():
+            lines.append(f"{name:<14} {p['calls']:>6} {p['total'] * 1000:>10.1f} {p['self'] * 1000:>10.1f} {p['max'] * 1000:>10.1f}")
+        lines.append(" ".join(f"{k}={v:g}" for k, v in sorted(self.counters.items())))
+        return "\n".join(lines) + "\n"
+
+    def trace_events(self) -> dict:
+        pid = os.getpid()
+        t0 = min([self._t0] + [s["start"] for s in self.spans])
+        events = [{"name": s["name"], "ph": "X", "ts": (s["start"] - t0) * 1e6, "dur": s["duration"] * 1e6,
+                   "pid": pid, "tid": s["tid"], "args": s["args"]} for s in self.spans]
+        events += [{"name": k, "ph": "C", "ts": (time.perf_counter() - t0) * 1e6, "pid": pid, "args": {k: v}}
+                   for k, v in self.counters.items()]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def openmetrics(self, prefix:str="prefect_wrapper", labels:Dict[str, str]=None) -> str:
+        labels = labels or {}
+        def fmt(extra:Dict[str, str]=None):
+            l = {**labels, **(extra or {})}
+            return "{" + ",".join(f'{k}="{v}"' for k, v in l.items()) + "}" if l else ""
+        lines = [f"# TYPE {prefix}_phase_seconds counter", f"# UNIT {prefix}_phase_seconds seconds"]
+        phases = self.phases()
+        lines += [f"{prefix}_phase_seconds_total{fmt({'phase': n})} {p['self']:.6f}" for n, p in phases.items()]
+        lines.append(f"# TYPE {prefix}_phase_calls counter")
+        lines += [f"{prefix}_phase_calls_total{fmt({'phase': n})} {p['calls']}" for n, p in phases.items()]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.append(f"{prefix}_{name}_total{fmt()} {value:g}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+profiler = Profiler()
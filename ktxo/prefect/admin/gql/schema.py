@@ -0,0 +1,90 @@
+"""
+Declarative columns for GQL classes, the GraphQL selection set is generated from the columns shown
+- path: field path in result objects (jmespath, plain dotted paths become nested selections)
+- name: column header
+- type: 'str', 'date' (converted to local time) or 'json' (first segment of path is a JSON column,
+        a plain dotted sub path is requested with Hasura 'path' argument, Ex: run_config(path:"labels"))
+- select: selection used as is instead of the generated one (Ex: fields with arguments)
+"""
+import re
+from typing import Dict, List, NamedTuple, Tuple
+
+_PLAIN_PATH = re.compile(r"[A-Za-z_]\w*(\.[A-Za-z_]\w*)*")
+
+class Column(NamedTuple):
+    path: str
+    name: str
+    type: str = "str"
+    select: str = None
+
+def _add(tree:Dict, keys:List[str]):
+    for k in keys[:-1]:
+        sub = tree.get(k)
+        if sub is None:
+            sub = tree[k] = {}
+        tree = sub
+    tree.setdefault(keys[-1], None)
+
+def _render(tree:Dict) -> str:
+    return ", ".join(k if sub is None else f"{k} {{{_render(sub)}}}" for k, sub in tree.items())
+
+def selection_set(columns:List[Column], extra:List[str]=None) -> Tuple[str, Dict[str, Tuple[str, List[str]]]]:
+    """
+    Return (selection, nest): nest maps each alias used for JSON sub paths to (JSON column, keys),
+    use unnest() on results to get the usual nested objects
+    """
+    tree = {}
+    raw = []
+    nest = {}
+    for c in columns:
+        if c.select:
+            raw.append(c.select)
+        elif c.type == "json":
+            keys = _PLAIN_PATH.match(c.path).group(0).split(".")
+            if len(keys) > 1 and _PLAIN_PATH.fullmatch(c.path):
+                alias = "__".join(keys)
+                nest[alias] = (keys[0], keys[1:])
+                raw.append(f'{alias}: {keys[0]}(path: "{".".join(keys[1:])}")')
+            else:
+                _add(tree, keys[:1])
+        else:
+            _add(tree, _PLAIN_PATH.match(c.path).group(0).split("."))
+    for e in extra or []:
+        _add(tree, e.split("."))
+    # A JSON column requested whole makes its sub paths unnecessary
+    for alias, (column, _) in list(nest.items()):
+        if column in tree and tree[column] is None:
+            raw.remove(next(r for r in raw if r.startswith(f"{alias}:")))
+            del nest[alias]
+    return ", ".join([s for s in [_render(tree)] + raw if s]), nest
+
+def unnest(values:List[dict], nest:Dict[str, Tuple[str, List[str]]]) -> List[dict]:
+    """Move aliased JSON sub paths back under their JSON column (in place)"""
+    if not nest or not values:
+        return values
+    for v in values:
+        if not isinstance(v, dict):
+            continue
+        for alias, (column, keys) in nest.items():
+            if alias not in v:
+                continue
+            value = v.pop(alias)
+            target = v.get(column)
+            if not isinstance(target, dict):
+                target = v[column] = {}
+            for k in keys[:-1]:
+                target = target.setdefault(k, {})
+            target[keys[-1]] = value
+    return values
+
+def select(columns:List[Column], names:List[str]) -> List[Column]:
+    """Columns by name (case insensitive) or path, in the given order"""
+    by_name = {c.name.upper(): c for c in columns}
+    by_path = {c.path: c for c in columns}
+    selected = []
+    for n in names:
+        c = by_name.get(n.strip().upper()) or by_path.get(n.strip())
+        if c is None:
+            raise ValueError(f"Unknown column '{n}', valid: {','.join(by_name)}")
+        selected.append(c)
+    return selected
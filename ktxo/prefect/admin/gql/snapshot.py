@@ -0,0 +1,240 @@
+"""
+Local copy (SQLite) of flows, flow runs, agents, projects and logs
+- sync(): fetch rows changed since the last sync (watermark), upsert them page by page in one transaction per page
+- SnapshotClient: read only client for GQL classes, queries run against the local tables
+  ('where', 'order_by', 'limit', 'offset', 'distinct_on' and '<object>_aggregate' count are translated to SQL)
+
+Each table has the scalar fields as columns (ad hoc SQL) and the whole object as JSON in 'doc'.
+Deleted rows are not detected, remove the file to start again
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Tuple
+
+from ktxo.prefect.admin.gql.base import GQLBase
+from ktxo.prefect.admin.gql.graphql import parse_arguments, parse_document, project
+from ktxo.prefect.admin.gql.profile import profiler
+
+DEFAULT_PAGE_SIZE = 1000
+
+class Table():
+    def __init__(self, name:str, root:str, columns:List[str], selection:str, indexes:List[str], watermark:str=None):
+        """
+        name: table (and object) name, root: query field in the API (Ex: 'agents' for 'agent')
+        columns: scalar fields stored as columns, first one is the primary key
+        selection: fields stored in 'doc', indexes: columns or dotted paths in 'doc' to index
+        """
+        self.name = name
+        self.root = root
+        self.columns = columns
+        self.selection = selection
+        self.indexes = indexes
+        self.watermark = watermark
+
+TABLES = {t.name: t for t in [
+    Table("flow", "flow",
+          ["id", "version", "name", "archived", "created", "updated", "is_schedule_active", "flow_group_id", "project_id", "core_version"],
+          "id, version, name, archived, created, updated, is_schedule_active, flow_group_id, project_id, core_version, "
+          "run_config, parameters, flow_group {id, default_parameters}, project {id, name}",
+          ["name", "flow_group_id", "updated"], "updated"),
+    Table("flow_run", "flow_run",
+          ["id", "version", "name", "flow_id", "agent_id", "state", "state_message", "scheduled_start_time", "start_time", "end_time", "created", "updated"],
+          "id, version, name, flow_id, agent_id, state, state_message, scheduled_start_time, start_time, end_time, created, updated, "
+          "labels, run_config, parameters, flow {id, name}, agent {id, name}",
+          ["flow_id", "state", "scheduled_start_time", "updated", "flow.name"], "updated"),
+    Table("agent", "agents",
+          ["id", "core_version", "name", "type", "created", "updated", "last_queried"],
+          "id, core_version, name, type, created, updated, last_queried, labels",
+          ["name"], "updated"),
+    Table("project", "project",
+          ["id", "name", "description", "created", "updated"],
+          "id, name, description, created, updated, flows_aggregate(distinct_on:flow_group_id){aggregate{count}}",
+          ["name"], "updated"),
+    Table("log", "log",
+          ["id", "flow_run_id", "task_run_id", "name", "level", "message", "timestamp"],
+          "id, flow_run_id, task_run_id, name, level, message, timestamp",
+          ["flow_run_id", "timestamp"], "timestamp"),
+]}
+# Query fields of the API -> table
+ROOTS = {t.root: t for t in TABLES.values()}
+
+class SnapshotError(ValueError):
+    """Query the snapshot can't answer (table, operator or mutation), the command needs the API"""
+
+class Snapshot():
+    def __init__(self, path:str):
+        self.path = os.path.expanduser(path)
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # One connection per thread (batched operations run on a pool of threads)
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            self._local.connection = connection
+        return connection
+
+    def create(self):
+        with self.connection as c:
+            for t in TABLES.values():
+                columns = ", ".join([f"{t.columns[0]} PRIMARY KEY"] + t.columns[1:] + ["doc"])
+                c.execute(f"CREATE TABLE IF NOT EXISTS {t.name} ({columns})")
+                for i in t.indexes:
+                    c.execute(f"CREATE INDEX IF NOT EXISTS {t.name}_{i.replace('.', '_')} ON {t.name} ({self.expression(t, i)})")
+        return self
+
+    def tables(self) -> List[str]:
+        return [r[0] for r in self.connection.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+
+    def expression(self, table:Table, path:str) -> str:
+        """SQL for a field: column or json_extract(doc, ...) (same text as the index to use it)"""
+        if path in table.columns:
+            return path
+        return f"json_extract(doc, '$.{path}')"
+
+    def watermark(self, table:Table):
+        if table.watermark is None:
+            return None
+        return self.connection.execute(f"SELECT max({table.watermark}) FROM {table.name}").fetchone()[0]
+
+    def count(self, table:Table) -> int:
+        return self.connection.execute(f"SELECT count(*) FROM {table.name}").fetchone()[0]
+
+    def upsert(self, table:Table, rows:List[dict]):
+        sql = f"INSERT OR REPLACE INTO {table.name} ({', '.join(table.columns + ['doc'])}) VALUES ({', '.join(['?'] * (len(table.columns) + 1))})"
+        with self.connection as c:
+            c.executemany(sql, [[r.get(k) for k in table.columns] + [json.dumps(r)] for r in rows])
+
+    def sync(self, client, names:List[str]=None, page_size:int=DEFAULT_PAGE_SIZE) -> List[list]:
+        """Copy rows created or changed since the last sync, return [[table, rows synced, total rows, watermark], ...]"""
+        self.create()
+        report = []
+        for name in names or list(TABLES):
+            table = TABLES[name]
+            watermark = self.watermark(table)
+            gql = GQLBase(
+                gql_string=f"""query F($watermark:timestamptz,$limit:Int,$offset:Int){{
+  {table.root}(where:{{{table.watermark}:{{_gte:$watermark}}}},limit:$limit,offset:$offset,order_by:[{{{table.watermark}:asc}},{{id:asc}}]){{
+  {table.selection}
+}}}}""",
+                object=table.root,
+                paged=True).set_client(client).set_paging(page_size)
+            synced = 0
+            with profiler.span("sync", table=name):
+                # Rows with the last watermark are fetched again and replaced
+                for page in gql.execute({"watermark": watermark}).pages():
+                    self.upsert(table, page)
+                    synced += len(page)
+            report.append([name, synced, self.count(table), self.watermark(table)])
+        return report
+
+    #-----------------------------------------------------------------------
+    #   Queries
+    #-----------------------------------------------------------------------
+    def where(self, table:Table, where:dict, prefix:str="") -> Tuple[str, list]:
+        """Hasura bool_exp to SQL, a null comparison value matches everything (as Hasura does)"""
+        clauses = []
+        params = []
+        for key, cond in (where or {}).items():
+            if key in ("_and", "_or"):
+                parts = [self.where(table, c, prefix) for c in (cond if isinstance(cond, list) else [cond] if cond else [])]
+                if parts:
+                    clauses.append("(" + (" AND " if key == "_and" else " OR ").join(p[0] for p in parts) + ")")
+                    params += [v for p in parts for v in p[1]]
+            elif key == "_not":
+                if cond:
+                    sql, values = self.where(table, cond, prefix)
+                    clauses.append(f"NOT {sql}")
+                    params += values
+            elif cond is None:
+                continue
+            elif any(k.startswith("_") for k in cond):
+                expression = self.expression(table, prefix + key)
+                for op, value in cond.items():
+                    if value is None:
+                        continue
+                    if op in OPERATORS:
+                        clauses.append(f"{expression} {OPERATORS[op]} ?")
+                        params.append(value)
+                    elif op in ("_in", "_nin"):
+                        clauses.append(f"{expression} {'NOT ' if op == '_nin' else ''}IN ({', '.join(['?'] * len(value))})")
+                        params += list(value)
+                    elif op == "_is_null":
+                        clauses.append(f"{expression} IS {'' if value else 'NOT '}NULL")
+                    else:
+                        raise SnapshotError(f"Operator '{op}' is not supported by the snapshot")
+            else:
+                sql, values = self.where(table, cond, f"{prefix}{key}.")
+                clauses.append(sql)
+                params += values
+        return "(" + (" AND ".join(clauses) or "1") + ")", params
+
+    def order_by(self, table:Table, order_by, prefix:str="") -> List[str]:
+        terms = []
+        for item in order_by if isinstance(order_by, list) else [order_by] if order_by else []:
+            for key, direction in item.items():
+                if isinstance(direction, dict):
+                    terms += self.order_by(table, direction, f"{prefix}{key}.")
+                    continue
+                expression = self.expression(table, prefix + key)
+                desc = direction.startswith("desc")
+                # Hasura default: nulls last for asc, first for desc
+                nulls_first = direction.endswith("nulls_first") or (desc and not direction.endswith("nulls_last"))
+                terms += [f"{expression} IS NULL {'DESC' if nulls_first else 'ASC'}", f"{expression} {'DESC' if desc else 'ASC'}"]
+        return terms
+
+    def resolve(self, name:str, args:dict):
+        aggregate = name.endswith("_aggregate")
+        table = ROOTS.get(name[:-len("_aggregate")] if aggregate else name) or TABLES.get(name[:-len("_aggregate")] if aggregate else name)
+        if table is None:
+            raise SnapshotError(f"'{name}' is not in the snapshot, tables: {','.join(TABLES)}")
+        where, params = self.where(table, args.get("where"))
+        if aggregate:
+            return {"aggregate": {"count": self.connection.execute(f"SELECT count(*) FROM {table.name} WHERE {where}", params).fetchone()[0]}}
+        sql = f"SELECT doc FROM {table.name} WHERE {where}"
+        distinct_on = args.get("distinct_on")
+        if distinct_on:
+            sql += " GROUP BY " + ", ".join(self.expression(table, c) for c in (distinct_on if isinstance(distinct_on, list) else [distinct_on]))
+        order_by = self.order_by(table, args.get("order_by"))
+        if order_by:
+            sql += " ORDER BY " + ", ".join(order_by)
+        if args.get("limit") is not None or args.get("offset"):
+            sql += " LIMIT ? OFFSET ?"
+            params += [-1 if args.get("limit") is None else args["limit"], args.get("offset") or 0]
+        return [json.loads(doc) for doc, in self.connection.execute(sql, params)]
+
+    def query(self, document:str, variables:dict) -> dict:
+        operation, fields = parse_document(document)
+        if operation == "mutation":
+            raise SnapshotError("The snapshot is read only")
+        return {f.alias: project(self.resolve(f.name, parse_arguments(f.args, variables)), f) for f in fields}
+
+OPERATORS = {"_eq": "=", "_neq": "!=", "_gt": ">", "_gte": ">=", "_lt": "<", "_lte": "<=", "_like": "LIKE"}
+
+
+class SnapshotResult(dict):
+    def to_dict(self) -> dict:
+        return self
+
+
+class SnapshotClient():
+    """Client for GQL classes (see GQLBase.set_client) that reads from a snapshot instead of the API"""
+    def __init__(self, path:str):
+        if not os.path.exists(os.path.expanduser(path)):
+            raise ValueError(f"Snapshot '{path}' not found, create it with 'sync --db {path}'")
+        self.snapshot = Snapshot(path)
+        self.api_server = f"sqlite:///{self.snapshot.path}"
+
+    def graphql(self, query:str, variables:Dict=None, raise_on_error:bool=True) -> SnapshotResult:
+        if isinstance(variables, str):
+            variables = json.loads(variables)
+        try:
+            with profiler.span("snapshot"):
+                return SnapshotResult(data=self.snapshot.query(query, variables or {}))
+        except (ValueError, sqlite3.Error) as e:
+            if raise_on_error:
+                raise
+            return SnapshotResult(data=None, errors=[{"message": str(e)}])
@@ -0,0 +1,93 @@
+"""
+Summary statistics over compact columns (array.array), vectorized with NumPy when it's installed
+- keys: group code per row (array 'q'), values: float per row (array 'd'), NaN: no value (Ex: run not finished)
+"""
+import datetime
+import math
+import re
+from array import array
+from typing import Dict, List, Tuple
+
+PERCENTILES = [50, 90, 95, 99]
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)([smhdw])")
+
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+def parse_duration(value:str) -> float:
+    """Seconds in '90s', '15m', '1h', '7d', '2w'"""
+    m = _DURATION.fullmatch(value.strip())
+    if m is None:
+        raise ValueError(f"Invalid duration '{value}', use <N>s|m|h|d|w (Ex: 1h, 7d)")
+    return float(m.group(1)) * _UNITS[m.group(2)]
+
+def parse_time(value:str, now:datetime.datetime=None) -> str:
+    """ISO timestamp (UTC) from an ISO date/time or a duration before now (Ex: '7d')"""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if _DURATION.fullmatch(value.strip()):
+        return (now - datetime.timedelta(seconds=parse_duration(value))).isoformat()
+    dt = datetime.datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return dt.astimezone(datetime.timezone.utc).isoformat()
+
+def to_epoch(d:str) -> float:
+    """ISO timestamp from API to seconds, NaN for None"""
+    if d is None:
+        return math.nan
+    try:
+        dt = datetime.datetime.fromisoformat(d)
+    except ValueError:
+        dt = datetime.datetime.strptime(d, '%Y-%m-%dT%H:%M:%S.%f%z')
+    return dt.timestamp()
+
+def bucket_keys(times:array, keys:array, groups:int, origin:float, size:float) -> array:
+    """Combine time bucket and group: bucket * groups + key, bucket = (time - origin) // size"""
+    np = _numpy()
+    if np is not None and len(times) > 0:
+        t = np.frombuffer(times, dtype=np.float64)
+        k = np.frombuffer(keys, dtype=np.int64)
+        combined = ((t - origin) // size).astype(np.int64) * groups + k
+        return array("q", combined.tobytes())
+    return array("q", (int((t - origin) // size) * groups + k for t, k in zip(times, keys)))
+
+def _percentile(values:List[float], p:float) -> float:
+    """Linear interpolation between closest ranks over sorted values (NumPy default method)"""
+    rank = (len(values) - 1) * p / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+def group_stats(keys:array, values:array, percentiles:List[float]=PERCENTILES) -> Dict[int, Tuple]:
+    """Per key: (rows, rows with value, mean, [percentiles], max), mean/percentiles/max are None without values"""
+    result = {}
+    np = _numpy()
+    if np is not None and len(keys) > 0:
+        k = np.frombuffer(keys, dtype=np.int64)
+        v = np.frombuffer(values, dtype=np.float64)
+        order = np.argsort(k, kind="stable")
+        k, v = k[order], v[order]
+        uniques, starts, counts = np.unique(k, return_index=True, return_counts=True)
+        for key, start, count in zip(uniques.tolist(), starts.tolist(), counts.tolist()):
+            g = v[start:start + count]
+            g = g[~np.isnan(g)]
+            if len(g) == 0:
+                result[key] = (count, 0, None, [None] * len(percentiles), None)
+            else:
+                result[key] = (count, len(g), float(g.mean()), np.percentile(g, percentiles).tolist(), float(g.max()))
+        return result
+    groups = {}
+    for key, value in zip(keys, values):
+        groups.setdefault(key, []).append(value)
+    for key, g in groups.items():
+        finite = sorted(x for x in g if not math.isnan(x))
+        if len(finite) == 0:
+            result[key] = (len(g), 0, None, [None] * len(percentiles), None)
+        else:
+            result[key] = (len(g), len(finite), sum(finite) / len(finite), [_percentile(finite, p) for p in percentiles], finite[-1])
+    return result
@@ -0,0 +1,160 @@
+"""
+Columnar results, one list per column, rows are built only when they are written
+- repeated strings (state, flow name, dates, ...) are stored once per column
+- filter: COL=VALUE (with * or ?: pattern), COL!=VALUE, COL>VALUE, COL>=VALUE, COL<VALUE, COL<=VALUE
+- sort: COL or COL:desc, comma separated, nulls last
+- group_by: rows per distinct value
+Filter and sort keep row numbers (the data isn't copied), '=' / '!=' and group_by use an index
+value -> row numbers built once per column
+"""
+import fnmatch
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+_FILTER = re.compile(r"([^=!<>]+?)\s*(!=|>=|<=|=|>|<)(.*)")
+
+def parse_filter(expr:str):
+    """'COL<op>VALUE' -> (COL, op, VALUE)"""
+    m = _FILTER.fullmatch(expr.strip())
+    if m is None:
+        raise ValueError(f"Invalid filter '{expr}', use COL=VALUE, COL!=VALUE, COL>VALUE, COL>=VALUE, COL<VALUE or COL<=VALUE")
+    return m.group(1).strip(), m.group(2), m.group(3).strip()
+
+def parse_sort(spec:str):
+    """'COL[:asc|desc],...' -> [(COL, descending), ...]"""
+    keys = []
+    for item in [s.strip() for s in spec.split(",") if s.strip()]:
+        name, _, direction = item.partition(":")
+        if direction.lower() not in ("", "asc", "desc"):
+            raise ValueError(f"Invalid sort '{item}', use COL, COL:asc or COL:desc")
+        keys.append((name.strip(), direction.lower() == "desc"))
+    return keys
+
+def _text(v:Any) -> str:
+    return "" if v is None else str(v)
+
+def _hashable(v:Any):
+    # Lists/dicts (Ex: labels) are indexed by their text
+    return v if not isinstance(v, (list, dict)) else _text(v)
+
+def _compare(value:str, sample:Any) -> Callable[[Any], Any]:
+    """Key to compare a column with 'value': numbers as numbers, anything else as text"""
+    if isinstance(sample, (int, float)) and not isinstance(sample, bool):
+        try:
+            float(value)
+            return float
+        except ValueError:
+            pass
+    return _text
+
+
+class ResultTable():
+    def __init__(self, cols:List[str]):
+        self.cols = list(cols)
+        self.columns = [[] for _ in self.cols]
+        # Row numbers shown, in order, None: all
+        self.rows = None
+        self._pools = [{} for _ in self.cols]
+        self._indexes = {}
+
+    @classmethod
+    def from_pages(cls, cols:List[str], pages:Iterable[List[List]]):
+        table = cls(cols)
+        for rows in pages:
+            table.append(rows)
+        return table
+
+    def append(self, rows:List[List]):
+        for j, values in enumerate(zip(*rows)):
+            pool = self._pools[j]
+            if pool is None:
+                self.columns[j].extend(values)
+                continue
+            self.columns[j].extend(pool.setdefault(v, v) if type(v) is str else v for v in values)
+            if len(pool) > max(len(self.columns[j]) // 2, 1000):
+                # Mostly distinct values (Ex: ids), sharing doesn't pay for the pool
+                self._pools[j] = None
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self.columns[0]) if self.rows is None and self.columns else len(self.rows or [])
+
+    def position(self, name:str) -> int:
+        for i, c in enumerate(self.cols):
+            if c.upper() == name.strip().upper():
+                return i
+        raise ValueError(f"Unknown column '{name}', valid: {','.join(self.cols)}")
+
+    def index(self, name:str) -> Dict[Any, List[int]]:
+        """value -> row numbers (all rows, ascending)"""
+        j = self.position(name)
+        if j not in self._indexes:
+            index = {}
+            for i, v in enumerate(self.columns[j]):
+                index.setdefault(_hashable(v), []).append(i)
+            self._indexes[j] = index
+        return self._indexes[j]
+
+    def selected(self) -> List[int]:
+        return list(range(len(self.columns[0]) if self.columns else 0)) if self.rows is None else self.rows
+
+    def filter(self, expr:str):
+        """Keep rows matching expr (see parse_filter), filters are combined with AND"""
+        name, op, value = parse_filter(expr)
+        if op in ("=", "!="):
+            pattern = any(c in value for c in "*?[")
+            matches = set()
+            for key, rows in self.index(name).items():
+                if fnmatch.fnmatchcase(_text(key), value) if pattern else _text(key) == value:
+                    matches.update(rows)
+            self.rows = [i for i in self.selected() if (i in matches) == (op == "=")]
+        else:
+            column = self.columns[self.position(name)]
+            sample = next((v for v in column if v is not None), None)
+            key = _compare(value, sample)
+            target = key(value)
+            test = {">": lambda v: v > target, ">=": lambda v: v >= target, "<": lambda v: v < target, "<=": lambda v: v <= target}[op]
+            self.rows = [i for i in self.selected() if column[i] is not None and test(key(column[i]))]
+        return self
+
+    def sort(self, spec:str):
+        """Order rows by spec (see parse_sort), stable"""
+        rows = self.selected()
+        for name, descending in reversed(parse_sort(spec)):
+            column = self.columns[self.position(name)]
+            present = [i for i in rows if column[i] is not None]
+            sample = column[present[0]] if present else None
+            key = (lambda v: v) if isinstance(sample, (int, float)) and not isinstance(sample, bool) else _text
+            try:
+                present.sort(key=lambda i: key(column[i]), reverse=descending)
+            except TypeError:
+                present.sort(key=lambda i: _text(column[i]), reverse=descending)
+            rows = present + [i for i in rows if column[i] is None]
+        self.rows = rows
+        return self
+
+    def group_by(self, name:str) -> "ResultTable":
+        """Table [name, ROWS], rows selected per distinct value in order of first appearance"""
+        j = self.position(name)
+        column = self.columns[j]
+        if self.rows is None:
+            rows = [[column[numbers[0]], len(numbers)] for numbers in self.index(name).values()]
+        else:
+            counts = {}
+            for i in self.rows:
+                key = _hashable(column[i])
+                if key in counts:
+                    counts[key][1] += 1
+                else:
+                    counts[key] = [column[i], 1]
+            rows = list(counts.values())
+        groups = ResultTable([self.cols[j], "ROWS"])
+        if rows:
+            groups.append(rows)
+        return groups
+
+    def iter_rows(self, size:int=1000) -> Iterator[List[List]]:
+        """Rows selected, 'size' rows at a time"""
+        rows = self.selected()
+        for start in range(0, len(rows), size):
+            yield [[c[i] for c in self.columns] for i in rows[start:start + size]]
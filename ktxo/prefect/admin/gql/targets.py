@@ -0,0 +1,87 @@
+"""
+Run a command against several Prefect backends/tenants at once (--targets FILE)
+FILE: [{"name": "prod", "api_server": "https://api.prefect.io", "api_key": "...", "tenant_id": "...", "timeout": 30}, ...]
+- one thread per target, each with its own client (see client.get_client) and its tables collected (see output.collect)
+- a target that doesn't finish in its timeout is reported as failed, the others are shown anyway
+- the tables of all targets are merged with a first column TARGET
+"""
+import json
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from ktxo.prefect.admin.gql import output
+
+DEFAULT_TIMEOUT = 60
+# Keys of a target passed to prefect.Client
+CLIENT_ARGS = ["api_server", "api_key", "tenant_id", "api_token"]
+
+class Target():
+    def __init__(self, name:str, client_args:dict, timeout:float=DEFAULT_TIMEOUT):
+        self.name = name
+        self.client_args = client_args
+        self.timeout = timeout
+
+def load(path:str, timeout:float=DEFAULT_TIMEOUT) -> List[Target]:
+    with open(path, "r") as fd:
+        items = json.load(fd)
+    if isinstance(items, dict):
+        # {"name": {...}, ...}
+        items = [{"name": k, **v} for k, v in items.items()]
+    targets = []
+    for i, item in enumerate(items):
+        unknown = [k for k in item if k not in CLIENT_ARGS + ["name", "timeout"]]
+        if unknown:
+            raise ValueError(f"Target {i} in '{path}': unknown key '{unknown[0]}', valid: name,timeout,{','.join(CLIENT_ARGS)}")
+        if not item.get("api_server"):
+            raise ValueError(f"Target {i} in '{path}': 'api_server' is required")
+        targets.append(Target(item.get("name") or item["api_server"],
+                              {k: item[k] for k in CLIENT_ARGS if item.get(k)},
+                              float(item.get("timeout") or timeout)))
+    if len({t.name for t in targets}) < len(targets):
+        raise ValueError(f"Duplicated target names in '{path}'")
+    return targets
+
+def run(targets:List[Target], command:Callable[[Target], None]) -> Tuple[List[list], List[Tuple[str, str]]]:
+    """
+    Run command(target) for all targets concurrently, return (tables, errors)
+    tables: [[cols, rows], ...] with TARGET as first column, errors: [(target name, error), ...]
+    """
+    results = [None] * len(targets)
+    def target_thread(i, target):
+        error = None
+        with output.collect() as tables:
+            try:
+                command(target)
+            except SystemExit as e:
+                error = f"exit code {e.code}" if e.code else None
+            except Exception as e:
+                error = f"{type(e).__name__}: {str(e)}"
+        results[i] = (tables, error)
+    # Daemon threads: a target past its timeout doesn't delay the exit
+    threads = [threading.Thread(target=target_thread, args=(i, t), name=f"target-{t.name}", daemon=True) for i, t in enumerate(targets)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    finished = []
+    errors = []
+    for i, (target, thread) in enumerate(zip(targets, threads)):
+        thread.join(max(0.0, start + target.timeout - time.monotonic()))
+        if thread.is_alive():
+            finished.append(None)
+            errors.append((target.name, f"no response in {target.timeout:g}s"))
+        else:
+            finished.append(results[i])
+            if results[i][1] is not None:
+                errors.append((target.name, results[i][1]))
+    return merge(targets, finished), errors
+
+def merge(targets:List[Target], results:List) -> List[list]:
+    """Table n of each target -> one table with column TARGET"""
+    merged = []
+    for target, result in zip(targets, results):
+        for n, table in enumerate(result[0] if result else []):
+            if n == len(merged):
+                merged.append([["TARGET"] + list(table.cols or []), []])
+            merged[n][1].extend([target.name] + list(row) for row in table.rows)
+    return merged
@@ -0,0 +1,67 @@
+import logging
+import time
+from typing import Dict, List
+from ktxo.prefect.admin.gql.base import GQLBase
+from ktxo.prefect.admin.gql.output import Writer
+
+_log = logging.getLogger("ktxo.prefect.admin")
+
+DEFAULT_INTERVAL = 5
+DEFAULT_MAX_INTERVAL = 60
+
+class Watcher():
+    """
+    Poll a GQL class with watermark (see GQLBase) and return only new or changed rows
+    - Each poll asks for rows with watermark >= highest watermark seen
+    - Rows at the highest watermark are remembered by id (with '>=' they come again in next poll)
+    - Without new rows the interval doubles up to max_interval, it's reset on activity
+    """
+    def __init__(self, gql:GQLBase, variables:dict, interval:float=DEFAULT_INTERVAL, max_interval:float=DEFAULT_MAX_INTERVAL, key:str="id"):
+        if gql.watermark is None:
+            raise ValueError(f"{type(gql).__name__} doesn't support watch mode (no watermark)")
+        self.gql = gql
+        self.variables = variables
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.key = key
+        self.watermark = None
+        self.seen:Dict[str, str] = {}
+
+    def poll(self) -> List:
+        rows = []
+        self.gql.execute(self.gql.watermark_variables(self.variables, self.watermark))
+        for page in self.gql.pages():
+            for row in page or []:
+                mark = row.get(self.gql.watermark)
+                if self.seen.get(row.get(self.key)) == mark and mark is not None:
+                    continue
+                rows.append(row)
+        if len(rows) > 0:
+            marks = [r.get(self.gql.watermark) for r in rows if r.get(self.gql.watermark) is not None]
+            watermark = max(marks + ([self.watermark] if self.watermark else []))
+            if watermark != self.watermark:
+                self.seen = {}
+                self.watermark = watermark
+            self.seen.update({r.get(self.key): watermark for r in rows if r.get(self.gql.watermark) == watermark})
+        return rows
+
+    def run(self, writer:Writer, polls:int=None):
+        """Write new rows until interrupted (or 'polls' polls)"""
+        interval = self.interval
+        count = 0
+        try:
+            while polls is None or count < polls:
+                rows = self.poll()
+                count += 1
+                _log.debug(f"Poll {count}: {len(rows)} rows, watermark={self.watermark}")
+                if len(rows) > 0:
+                    writer.write_page(rows, self.gql.build_table)
+                    writer.flush()
+                    interval = self.interval
+                else:
+                    interval = min(interval * 2, self.max_interval)
+                if polls is None or count < polls:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        writer.close()
@@ -1,6 +1,8 @@
 """
 Prefect Admin wrapper
 """
+import time
+_t0 = time.perf_counter()
 
 import argparse
 import getpass
@@ -10,21 +12,34 @@ import logging.config
 import os
 import re
 import sys
-import prefect
+import threading
+from typing import TYPE_CHECKING
 from ktxo.prefect.admin import _about as about
+from ktxo.prefect.admin.gql import batch, cache, export, output, stats, targets, watch
+from ktxo.prefect.admin.gql.base import GQLBase
+from ktxo.prefect.admin.gql.client import get_client
+from ktxo.prefect.admin.gql.profile import profiler
 from ktxo.prefect.admin.gql.gql_admin import (GQLSecretQuery, GQLSecretList,
                                               GQLFlowList, GQLFlowQuery,
                                               GQLFlowScheduleEnable,GQLFlowScheduleDisable,
-                                              GQLFlowRunList,
+                                              GQLFlowRunList, GQLFlowRunStats,
                                               GQLProjectList,
-                                              GQLAgentList,
-                                              GQLSetParameter)
+                                              GQLAgentList, GQLLogExport,
+                                              GQLSetParameter, GQLFlowGroupParameters)
 
 #---------------------------------------------------------------------------
 # Global vars
 #---------------------------------------------------------------------------
 _log = logging.getLogger("ktxo.prefect.admin")
-client:prefect.Client = None
+# 'prefect' is imported when the client is created, -v/--help don't need it
+if TYPE_CHECKING:
+    import prefect
+client:"prefect.Client" = None
+# Client of the target run by each thread with --targets
+_target = threading.local()
+response_cache:cache.ResponseCache = None
+CACHE_ENV = "PREFECT_WRAPPER_CACHE"
+SOCKET_ENV = "PREFECT_WRAPPER_SOCKET"
 
 #---------------------------------------------------------------------------
 #   Versions helper
@@ -32,7 +47,11 @@ client:prefect.Client = None
 def get_version():
     """Get version: python, current script and other needed"""
     python_version=sys.version.replace('\n','')
-    prefect_version=prefect.__version__
+    try:
+        from importlib.metadata import version
+        prefect_version = version("prefect")
+    except Exception:
+        prefect_version = "not installed"
     return [f'{about.__name__} v{about.__version__} ({about.__date__}) by {about.__author__}',
             about.__version__,
             f"Python version {python_version}",
@@ -58,6 +77,9 @@ Examples:
 - Set parameter 'A=1' to flow_group_id=a4846d5b-5371-4cf8-8251-a33d30497300, log level DEBUG
 {about.__name__} -LD flow -p A=1 -g a4846d5b-5371-4cf8-8251-a33d30497300
 
+- Disable schedule for flows listed in /tmp/flows.txt, keep failed ones in /tmp/failed.txt to retry them
+{about.__name__} flow -sd @/tmp/flows.txt --failed-file /tmp/failed.txt
+
 - Get details from flow DUMMY_FLOW
 {about.__name__} flow -q DUMMY_FLOW 
 
@@ -67,13 +89,51 @@ Examples:
 - Execute GraphQL from class 'GQLLog' include in 'dummy.gql_example.py' with args from json file '/tmp/gql_log.json'
 {about.__name__}  api --execute dummy.gql_example.GQLLog -p /tmp/gql_log.json
 
+- Execute several classes concurrently (output in the same order)
+{about.__name__}  api --execute ktxo.prefect.admin.gql.gql_admin.GQLAgentList ktxo.prefect.admin.gql.gql_admin.GQLProjectList
+
 - Get flow runs for flow 'DUMMY_FLOW'
 {about.__name__}  flow_run -l DUMMY_FLOW
 
+- Runs per flow and state in the last 24 hours with duration percentiles, per hour
+{about.__name__} flow_run --stats --since 24h --bucket 1h
+
+- Failed runs of flow 'DUMMY_FLOW' sorted by start time (newest first), and runs per state
+{about.__name__} --filter STATE=Failed --sort START:desc flow_run -l DUMMY_FLOW
+{about.__name__} --view-group-by STATE --sort ROWS:desc flow_run -l DUMMY_FLOW
+
+- Logs of the last 2 days as gzip NDJSON, 6 hours per shard (run again to continue if interrupted)
+{about.__name__} log --export /tmp/logs.ndjson.gz --since 2d --shard 6h
+
+- Agents of all backends/tenants in targets.json (Ex: [{{"name": "prod", "api_server": "https://api.prefect.io", "api_key": "..."}}])
+{about.__name__} --targets targets.json --target-timeout 20 agent -l
+
+- Copy flows, runs, agents, projects and logs to a local file (again to get only the changes), then query it
+{about.__name__} sync --db ~/prefect.sqlite
+{about.__name__} --from-snapshot ~/prefect.sqlite flow_run --stats --since 30d
+
+- Only id, state and labels of the flow runs (only these fields are requested)
+{about.__name__} -c ID,STATE,RUN_CONFG_LABELS flow_run -l DUMMY_FLOW
+
+- Follow logs from a flow run, new lines are shown as they arrive
+{about.__name__} -f ndjson api --execute dummy.gql_example.GQLLog -p /tmp/gql_log.json --watch
+
+- Keep a process running and send commands to it
+{about.__name__} serve &
+{about.__name__} --connect /tmp/prefect_wrapper-UID.sock agent -l
+
 '''
 #---------------------------------------------------------------------------
-def parse_args():
-    """Command arg parse"""
+def add_watch_arguments(parser):
+    parser.add_argument("--watch", metavar="SECONDS", help=f"Keep polling and show only new or changed rows (default every {watch.DEFAULT_INTERVAL}s)",
+                        nargs='?', const=watch.DEFAULT_INTERVAL, type=float)
+    parser.add_argument("--watch-max", metavar="SECONDS", help=f"Without changes the polling interval doubles up to SECONDS (default {watch.DEFAULT_MAX_INTERVAL})",
+                        default=watch.DEFAULT_MAX_INTERVAL, type=float)
+
+def parse_args(argv:list=None):
+    """Command arg parse, argv: command line without program name (default sys.argv)"""
+    if argv is None:
+        argv = sys.argv[1:]
     parser = argparse.ArgumentParser(prog=about.__name__,
                                      description=about.__description_message__,
                                      epilog=example_usage,
@@ -88,21 +148,46 @@ def parse_args():
     flow_parser = subparser.add_parser("flow")
     flow_parser.add_argument("-q", "--query", metavar="FLOW_NAME", help="Get flow details", type=str)
     flow_parser.add_argument("-l", "--list", help="List flows", action='store_true')
-    flow_parser.add_argument("-se", "--schedule_enable", metavar="FLOW_ID", help="Enable schedule flows")
-    flow_parser.add_argument("-sd", "--schedule_disable",metavar="FLOW_ID", help="Disable schedule flows")
+    flow_parser.add_argument("-se", "--schedule_enable", metavar="FLOW_ID", help="Enable schedule flows. Use '-' to read ids from stdin or '@FILE' from a file", nargs='+')
+    flow_parser.add_argument("-sd", "--schedule_disable",metavar="FLOW_ID", help="Disable schedule flows. Use '-' to read ids from stdin or '@FILE' from a file", nargs='+')
     flow_parser.add_argument("-p", "--parameter", help="Set parameters flow", nargs='+')
-    flow_parser.add_argument("-g", "--group", metavar="FLOW_GROUP_ID", help="Flow group id")
+    flow_parser.add_argument("-g", "--group", metavar="FLOW_GROUP_ID", help="Flow group id. Use '-' to read ids from stdin or '@FILE' from a file", nargs='+')
+    flow_parser.add_argument("--sync-parameters", metavar="JSON_FILE", help="Set default parameters from a JSON file {FLOW_GROUP_ID: {PARAMETER: VALUE}}, only groups with changes are updated")
+    flow_parser.add_argument("--dry-run", help="With --sync-parameters, show the plan without updating", action='store_true')
+    flow_parser.add_argument("--failed-file", metavar="FILE", help="Write ids that failed (-se/-sd/-p) to FILE, retry them with '@FILE'")
     flow_parser.add_argument("-a", "--archived", help="Include archived flows", action='store_false',default=True)
 
     flow_run_parser = subparser.add_parser("flow_run")
     flow_run_parser.add_argument("-l", "--list", metavar="FLOW_NAME", help="List flow runs")
+    add_watch_arguments(flow_run_parser)
+    flow_run_parser.add_argument("--stats", help="Runs per group counted by the server and duration percentiles (seconds). With '-l' only runs of FLOW_NAME", action='store_true')
+    flow_run_parser.add_argument("--since", metavar="TIME", help="With --stats, runs scheduled from TIME, ISO date/time or time ago (Ex: 24h, 7d). Default 7d",
+                                 type=stats.parse_time, default="7d")
+    flow_run_parser.add_argument("--until", metavar="TIME", help="With --stats, runs scheduled before TIME", type=stats.parse_time)
+    flow_run_parser.add_argument("--group-by", metavar="GROUP", help="With --stats, group by 'flow' and/or 'state' (default flow state)",
+                                 nargs='*', choices=["flow", "state"], default=["flow", "state"])
+    flow_run_parser.add_argument("--bucket", metavar="DURATION", help="With --stats, also split by scheduled time in buckets of DURATION (Ex: 1h, 1d)",
+                                 type=stats.parse_duration)
 
     agent_parser = subparser.add_parser("agent")
     agent_parser.add_argument("-l", "--list", help="List agents", action='store_true')
 
+    log_parser = subparser.add_parser("log", help="Export logs")
+    log_parser.add_argument("--export", metavar="FILE", help="Write logs as gzip NDJSON to FILE, time range (or flow runs) fetched in parallel shards. "
+                                                            "Run again with the same arguments to continue an interrupted export")
+    log_parser.add_argument("--since", metavar="TIME", help="Logs from TIME, ISO date/time or time ago (Ex: 24h, 7d). Default 1d without --flow-run",
+                            type=lambda v: stats.parse_time(v) and v)
+    log_parser.add_argument("--until", metavar="TIME", help="Logs before TIME (default now)", type=lambda v: stats.parse_time(v) and v)
+    log_parser.add_argument("--flow-run", metavar="FLOW_RUN_ID", help="Logs of these flow runs, one shard each. Use '-' to read ids from stdin or '@FILE' from a file", nargs='+')
+    log_parser.add_argument("--shard", metavar="DURATION", help=f"Time range of each shard (default {export.DEFAULT_SHARD})", default=export.DEFAULT_SHARD,
+                            type=lambda v: stats.parse_duration(v) and v)
+    log_parser.add_argument("--state", metavar="FILE", help="Shards already exported (default FILE.state)")
+
     api_parser = subparser.add_parser("api")
-    api_parser.add_argument("-e", "--execute", metavar="PACKAGE.CLASS", help="Allow to execute GraphQL against Prefect API")
+    api_parser.add_argument("-e", "--execute", metavar="PACKAGE.CLASS", help="Allow to execute GraphQL against Prefect API, several classes run concurrently (same variables)",
+                            nargs='+')
     api_parser.add_argument("-p", "--variables", help="Set variables for class that implement GraphQL", nargs='*')
+    add_watch_arguments(api_parser)
 
     # register_parser = subparser.add_parser("register")
     # register_parser.add_argument("-r", "--register", metavar="PROJECT_ID", help="Register a flow")
@@ -112,8 +197,44 @@ def parse_args():
     project_parser = subparser.add_parser("project")
     project_parser.add_argument("-l", "--list", help="Query projects", action='store_true', default=True)
 
-    parser.add_argument("-f", "--format", help="Output format", default="text")
-
+    serve_parser = subparser.add_parser("serve", help="Keep running and execute commands received on a Unix socket")
+    serve_parser.add_argument("-s", "--socket", metavar="PATH", help="Socket path (default $XDG_RUNTIME_DIR or /tmp, file prefect_wrapper-UID.sock)")
+
+    subparser.add_parser("repl", help="Interactive session, one command per line")
+
+    sync_parser = subparser.add_parser("sync", help="Copy flows, flow runs, agents, projects and logs to a local SQLite file, only rows changed since the last sync")
+    sync_parser.add_argument("--db", metavar="PATH", help="SQLite file, created if it doesn't exist", required=True)
+    sync_parser.add_argument("--tables", metavar="TABLE", help="Tables to sync (default all: flow flow_run agent project log)", nargs='+')
+
+    parser.add_argument("-f", "--format", help="Output format", choices=output.FORMATS, default="text")
+    parser.add_argument("-c", "--columns", metavar="COL,...", help="Show only these columns (name or field path, comma separated), only the fields needed are requested",
+                        type=lambda v: [c for c in v.split(",") if c.strip()])
+    parser.add_argument("--filter", metavar="COL=EXPR", help="Show only rows where COL=VALUE (* and ? as wildcards), COL!=VALUE, COL>VALUE, COL>=VALUE, COL<VALUE or COL<=VALUE. "
+                                                            "Can be repeated (AND), applied in memory after the query", action='append')
+    parser.add_argument("--sort", metavar="COL[:desc],...", help="Sort rows in memory by these columns")
+    parser.add_argument("--view-group-by", metavar="COL", help="Show rows per distinct value of COL (after --filter)", dest="view_group_by")
+    parser.add_argument("--sample-rows", metavar="ROWS", help=f"Text format, column widths from the first ROWS rows, next rows are written as they arrive. 0: all rows (default {output.DEFAULT_SAMPLE_ROWS})", type=int)
+    parser.add_argument("--page-size", metavar="ROWS", help=f"Rows fetched per request for paged queries (default {GQLBase.DEFAULT_PAGE_SIZE})", type=int)
+    parser.add_argument("--max-rows", metavar="ROWS", help="Stop paged queries after ROWS rows", type=int)
+    parser.add_argument("--batch-size", metavar="ITEMS", help=f"Items sent per request for batched operations (default {batch.DEFAULT_BATCH_SIZE})", type=int)
+    parser.add_argument("--workers", metavar="N", help=f"Concurrent requests for batched operations and 'api -e' with several classes (default {batch.DEFAULT_WORKERS})", type=int)
+
+    parser.add_argument("--cache", help=f"Reuse results of read only queries from a disk cache in {cache.DEFAULT_DIR}. "
+                                        f"Also enabled with env var {CACHE_ENV}=DIR", action='store_true')
+    parser.add_argument("--cache-dir", metavar="DIR", help="Cache in DIR instead of the default one, enables the cache")
+    parser.add_argument("--no-cache", help="Disable the cache", action='store_true')
+    parser.add_argument("--refresh", help="Ignore cached results, store new ones", action='store_true')
+    parser.add_argument("--from-snapshot", metavar="PATH", help="Read from a SQLite file created with 'sync' instead of the API")
+    parser.add_argument("--targets", metavar="FILE", help="Run the command against all Prefect backends/tenants in FILE concurrently, results with column TARGET. "
+                                                         "FILE: JSON list of {name, api_server, api_key, tenant_id, timeout}")
+    parser.add_argument("--target-timeout", metavar="SECONDS", help=f"With --targets, targets without response in SECONDS are reported as failed (default {targets.DEFAULT_TIMEOUT})",
+                        type=float, default=targets.DEFAULT_TIMEOUT)
+    parser.add_argument("--connect", metavar="PATH", help=f"Send the command to a running '{about.__name__} serve'. "
+                                                         f"Also with env var {SOCKET_ENV}=PATH", default=os.environ.get(SOCKET_ENV))
+    parser.add_argument("--profile", help="Show time per phase (client_init, request, decode, extract, render) and counters on stderr", action='store_true')
+    parser.add_argument("--profile-format", help="Format for --profile, 'json' for trace events (chrome://tracing, Perfetto), enables --profile",
+                        choices=["text", "json"])
+    parser.add_argument("--metrics-file", metavar="FILE", help="Write phase times and counters to FILE (OpenMetrics text format)")
     parser.add_argument("-l", "--log", help="Logging configuration file")
 
     parser.add_argument("-L", "--log_level",
@@ -125,7 +246,7 @@ def parse_args():
                         help="Show script version",
                         action='store_true')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     if args.version:
         show_version()
         sys.exit(0)
@@ -134,10 +255,11 @@ def parse_args():
         parser.error(f"Option 'parameter' requires option 'group', use command 'flow' + 'list' to query this value")
 
     # No arguments received or missing
-    if len(sys.argv) == 1 or args.command is None or \
+    if len(argv) == 0 or args.command is None or \
             args.command in ["secret"] and (any([args.list, args.query, args.set]) == False) or \
-            args.command in ["flow"] and (any([args.list, args.query,args.parameter,args.schedule_enable,args.schedule_disable]) == False) or \
-            args.command in ["flow_run"] and (any([args.list]) == False) or \
+            args.command in ["flow"] and (any([args.list, args.query,args.parameter,args.schedule_enable,args.schedule_disable,args.sync_parameters]) == False) or \
+            args.command in ["flow_run"] and (any([args.list, args.stats]) == False) or \
+            args.command in ["log"] and not args.export or \
             (args.command in ["agent"] and any([args.list]) == False):
         #parser.print_usage()
         parser.error("Ops, missing arguments")
@@ -177,6 +299,52 @@ def build_variables(params:list):
 
     return variables
 #---------------------------------------------------------------------------
+def read_ids(values:list):
+    """Expand ids from command line: 'ID', '-' (one id per line from stdin) or '@FILE' (one id per line)"""
+    ids = []
+    for v in values:
+        if v == "-":
+            lines = sys.stdin.readlines()
+        elif v.startswith("@"):
+            with open(v[1:], "r") as fd:
+                lines = fd.readlines()
+        else:
+            lines = [v]
+        ids.extend([l.strip() for l in lines if l.strip()])
+    return ids
+#---------------------------------------------------------------------------
+def report_mutation(gql, args):
+    """Print per item result, write failed ids to 'failed_file' and exit with error if any failed"""
+    gql.print(args.format)
+    failed = gql.failed()
+    if args.failed_file:
+        with open(args.failed_file, "w") as fd:
+            fd.writelines([f"{f}\n" for f in failed])
+    if len(failed) > 0:
+        _log.error(f"{len(failed)} of {len(gql.values)} failed")
+        _log.info(f"Aplication end, pid={os.getpid()}")
+        sys.exit(1)
+#---------------------------------------------------------------------------
+def print_or_watch(gql, variables, args):
+    """Execute and print, with '--watch' keep printing new/changed rows until interrupted"""
+    if args.watch:
+        if args.filter or args.sort or args.view_group_by:
+            _log.error("--watch doesn't allow --filter, --sort or --view-group-by")
+            sys.exit(1)
+        watcher = watch.Watcher(gql, variables, args.watch, args.watch_max)
+        watcher.run(output.get_writer(args.format, gql.cols, sample_rows=gql.sample_rows))
+    else:
+        check_view(gql.execute(variables)).print(args.format)
+
+def check_view(gql):
+    """Columns of --filter, --sort and --view-group-by for classes that set their columns on execute()"""
+    try:
+        gql.check_view()
+    except ValueError as e:
+        _log.error(str(e))
+        sys.exit(1)
+    return gql
+#---------------------------------------------------------------------------
 def load_class(package_class):
     import importlib
     module_file=".".join(package_class.split(".")[:-1])
@@ -186,11 +354,51 @@ def load_class(package_class):
     class_ = getattr(module, class_name)
     return class_
 #---------------------------------------------------------------------------
+def init_cache(args):
+    global response_cache
+    path = args.cache_dir or os.environ.get(CACHE_ENV) or (cache.DEFAULT_DIR if args.cache else None)
+    response_cache = None
+    if path and not args.no_cache:
+        response_cache = cache.ResponseCache(path, refresh=args.refresh)
+        _log.info(f"Using cache {path}")
+#---------------------------------------------------------------------------
+def current_client():
+    """Client of the target run by this thread (--targets), otherwise the one from Prefect config"""
+    return getattr(_target, "client", None) or client or get_client()
+#---------------------------------------------------------------------------
+def create_gql(class_, args):
+    """Instance a GQL class with the options from command line"""
+    gql = class_()
+    gql.set_paging(args.page_size, args.max_rows)
+    gql.set_batch(args.batch_size, args.workers)
+    gql.set_cache(response_cache)
+    gql.set_output(args.sample_rows)
+    try:
+        if args.from_snapshot:
+            # sqlite3 is loaded only for --from-snapshot and sync
+            from ktxo.prefect.admin.gql import snapshot
+            gql.set_client(snapshot.SnapshotClient(args.from_snapshot))
+        else:
+            gql.set_client(current_client())
+        if args.columns:
+            gql.set_columns(args.columns)
+        gql.set_view(args.filter, args.sort, args.view_group_by)
+    except ValueError as e:
+        _log.error(str(e))
+        sys.exit(1)
+    return gql
+#---------------------------------------------------------------------------
 #   Main
 #---------------------------------------------------------------------------
 def main():
     global client
     args = parse_args()
+    if args.connect and args.command not in ["serve", "repl"]:
+        # Only resident mode needs module server (Unix sockets)
+        from ktxo.prefect.admin import server
+        sys.exit(server.send(args.connect, strip_connect(sys.argv[1:])))
+    if args.profile or args.profile_format or args.metrics_file:
+        profiler.enable().add_span("imports", _t0, time.perf_counter())
     init_log(args)
 
     _log.info(get_version()[0])
@@ -199,26 +407,145 @@ def main():
 
     _log.info(f"Starting pid={os.getpid()}")
     _log.info(f"Using args {args}")
-    client = prefect.Client()
+    if not args.from_snapshot and not args.targets:
+        client = get_client()
+    init_cache(args)
+
+    if args.command == "serve":
+        from ktxo.prefect.admin import server
+        server.serve(args.socket or server.default_socket(), run_command)
+    elif args.command == "repl":
+        from ktxo.prefect.admin import server
+        server.repl(lambda argv, stdin: run_command(argv, stdin, capture=False), prompt=f"{about.__name__}> ")
+    else:
+        errors = ()
+        if args.from_snapshot:
+            from ktxo.prefect.admin.gql import snapshot
+            errors = (snapshot.SnapshotError,)
+        try:
+            with profiler.span("command", command=args.command):
+                execute(args)
+        except errors as e:
+            _log.error(f"--from-snapshot: {str(e)}")
+            sys.exit(1)
+        finally:
+            write_profile(args)
+
+    _log.info(f"Aplication end, pid={os.getpid()}")
+
+def write_profile(args):
+    if args.profile_format == "json":
+        sys.stderr.write(json.dumps(profiler.trace_events()) + "\n")
+    elif args.profile or args.profile_format:
+        sys.stderr.write(profiler.summary())
+    if args.metrics_file:
+        with open(args.metrics_file, "w") as fd:
+            fd.write(profiler.openmetrics(labels={"command": args.command}))
+
+#---------------------------------------------------------------------------
+def strip_connect(argv:list):
+    """Command line without option '--connect'"""
+    argv = list(argv)
+    for i, a in enumerate(argv):
+        if a == "--connect":
+            return argv[:i] + argv[i + 2:]
+        if a.startswith("--connect="):
+            return argv[:i] + argv[i + 1:]
+    return argv
+
+def run_command(argv:list, stdin:str=None, capture:bool=True):
+    """Run one command line in this process (serve/repl), return (exit code, output)"""
+    global response_cache
+    import contextlib
+    import io
+    output = io.StringIO()
+    rc = 0
+    stdin_ = sys.stdin
+    cache_ = response_cache
+    try:
+        with contextlib.ExitStack() as stack:
+            if capture:
+                stack.enter_context(contextlib.redirect_stdout(output))
+                stack.enter_context(contextlib.redirect_stderr(output))
+                # Log handlers write to the server's stderr, messages of this command go to the client too
+                handler = logging.StreamHandler(output)
+                handler.setFormatter(logging.Formatter("%(levelname)s %(module)s - %(funcName)s: %(message)s"))
+                logging.getLogger("ktxo.prefect.admin").addHandler(handler)
+                stack.callback(logging.getLogger("ktxo.prefect.admin").removeHandler, handler)
+            if stdin is not None:
+                sys.stdin = io.StringIO(stdin)
+            args = parse_args(argv)
+            if capture:
+                handler.setLevel(LOG_LEVELS.get(args.log_level, logging.INFO))
+            if args.command in ["serve", "repl"]:
+                raise ValueError(f"Command '{args.command}' is already running")
+            if args.command == "secret" and args.set and capture:
+                raise ValueError("Use 'secret --set' from command line or 'repl', it needs a terminal")
+            if any([args.cache, args.cache_dir, args.no_cache, args.refresh]):
+                init_cache(args)
+            _log.info(f"Using args {args}")
+            execute(args)
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception as e:
+        _log.exception(f"Command {argv} failed")
+        rc = 1
+        output.write(f"{type(e).__name__}: {str(e)}\n")
+    finally:
+        sys.stdin = stdin_
+        response_cache = cache_
+    return rc, output.getvalue()
 
-    # ---------------------------------------------------------------------------
-    #   Application code
-    # ---------------------------------------------------------------------------
+#---------------------------------------------------------------------------
+def execute_targets(args):
+    """Execute the command in args for each target in '--targets' concurrently, print the merged results"""
+    if args.command in ["sync", "log", "serve", "repl"] or (args.command == "secret" and args.set) or getattr(args, "watch", None) or args.from_snapshot:
+        _log.error("--targets doesn't allow 'sync', 'log', 'secret --set', --watch or --from-snapshot")
+        sys.exit(1)
+    if getattr(args, "failed_file", None):
+        # Ids are per backend, one file for all targets couldn't be retried with '@FILE'
+        _log.error("--targets doesn't allow --failed-file")
+        sys.exit(1)
+    try:
+        targets_ = targets.load(args.targets, args.target_timeout)
+    except (OSError, ValueError) as e:
+        _log.error(str(e))
+        sys.exit(1)
+    target_args = argparse.Namespace(**{**vars(args), "targets": None})
+    def command(target):
+        _target.client = get_client(**target.client_args)
+        execute(target_args)
+    tables, errors = targets.run(targets_, command)
+    for n, (cols, rows) in enumerate(tables):
+        if n > 0 and args.format == "text":
+            print()
+        writer = output.get_writer(args.format, cols, sample_rows=output.DEFAULT_SAMPLE_ROWS if args.sample_rows is None else args.sample_rows)
+        writer.write_page(rows if writer.TABLE else [dict(zip(cols, r)) for r in rows], lambda rows: rows)
+        writer.close()
+    for name, error in errors:
+        _log.error(f"Target '{name}': {error}")
+    if len(errors) > 0:
+        sys.exit(1)
+#---------------------------------------------------------------------------
+def execute(args):
+    """Application code, execute the command in args"""
+    if args.targets:
+        return execute_targets(args)
     if args.command == "secret" and args.set:
         secret_value = getpass.getpass(f"Enter value for secret '{args.set}':")
-        client.set_secret(name=args.set, value=secret_value)
+        current_client().set_secret(name=args.set, value=secret_value)
     elif args.command == "secret" and args.query:
-        gql = GQLSecretQuery()
+        gql = create_gql(GQLSecretQuery, args)
         gql.execute(args.query).print(args.format)
     elif args.command == "secret" and args.list:
-        gql = GQLSecretList()
+        gql = create_gql(GQLSecretList, args)
         gql.execute().print(args.format)
 
     elif args.command == "flow" and args.list:
         variables ={}
         if args.archived:
             variables = {"flow_name": args.query, "archived": False}
-        gql = GQLFlowList()
+        gql = create_gql(GQLFlowList, args)
         gql.execute(variables).print(args.format)
 
     elif args.command == "flow" and args.query:
@@ -226,42 +553,95 @@ def main():
             variables = {"flow_name": args.query, "archived": False}
         else:
             variables = {"flow_name": args.query}
-        gql = GQLFlowQuery()
+        gql = create_gql(GQLFlowQuery, args)
         gql.execute(variables).print(args.format)
 
     elif args.command == "flow" and args.parameter:
         parameters = build_variables(args.parameter)
-        gql = GQLSetParameter()
-        gql.execute({"flow_group_id": args.group,"parameters": parameters})
+        gql = create_gql(GQLSetParameter, args)
+        gql.execute_many([{"flow_group_id": g, "parameters": parameters} for g in read_ids(args.group)])
+        report_mutation(gql, args)
+
+    elif args.command == "flow" and args.sync_parameters:
+        with open(args.sync_parameters, "r") as fd:
+            desired = json.load(fd)
+        gql = create_gql(GQLFlowGroupParameters, args)
+        plan = gql.plan(desired)
+        gql.print(args.format)
+        updates = [{"flow_group_id": p[0], "parameters": desired[p[0]]} for p in plan if p[1] == "update"]
+        _log.info(f"{len(updates)} of {len(plan)} flow groups to update")
+        for p in plan:
+            if p[1] == "not found":
+                _log.warning(f"Flow group '{p[0]}' not found")
+        if len(updates) > 0 and not args.dry_run:
+            gql = create_gql(GQLSetParameter, args)
+            gql.execute_many(updates)
+            report_mutation(gql, args)
 
     elif args.command == "flow" and args.schedule_enable:
-        gql = GQLFlowScheduleEnable()
-        gql.execute({"flow_id": args.schedule_enable})
+        gql = create_gql(GQLFlowScheduleEnable, args)
+        gql.execute_many([{"flow_id": f} for f in read_ids(args.schedule_enable)])
+        report_mutation(gql, args)
 
     elif args.command == "flow" and args.schedule_disable:
-        gql = GQLFlowScheduleDisable()
-        gql.execute({"flow_id": args.schedule_disable})
+        gql = create_gql(GQLFlowScheduleDisable, args)
+        gql.execute_many([{"flow_id": f} for f in read_ids(args.schedule_disable)])
+        report_mutation(gql, args)
+
+    elif args.command == "flow_run" and args.stats:
+        gql = create_gql(GQLFlowRunStats, args).set_stats(args.group_by, args.bucket)
+        check_view(gql.execute({"flow_name": args.list, "since": args.since, "until": args.until})).print(args.format)
 
     elif args.command == "flow_run" and args.list:
-        gql = GQLFlowRunList()
-        gql.execute({"flow_name": args.list}).print(args.format)
+        gql = create_gql(GQLFlowRunList, args)
+        print_or_watch(gql, {"flow_name": args.list}, args)
 
     elif args.command == "project" and args.list:
-        gql = GQLProjectList()
+        gql = create_gql(GQLProjectList, args)
         gql.execute().print(args.format)
 
     elif args.command == "agent" and args.list:
-        gql = GQLAgentList()
+        gql = create_gql(GQLAgentList, args)
         gql.execute().print(args.format)
 
+    elif args.command == "sync":
+        from ktxo.prefect.admin.gql import snapshot
+        unknown = [t for t in args.tables or [] if t not in snapshot.TABLES]
+        if unknown:
+            _log.error(f"Unknown table '{unknown[0]}', valid: {','.join(snapshot.TABLES)}")
+            sys.exit(1)
+        db = snapshot.Snapshot(args.db)
+        writer = output.get_writer(args.format, ["TABLE", "SYNCED", "ROWS", "WATERMARK"], sample_rows=0)
+        writer.write_page(db.sync(get_client(), args.tables, args.page_size or snapshot.DEFAULT_PAGE_SIZE), lambda rows: rows)
+        writer.close()
+
+    elif args.command == "log" and args.export:
+        gql = create_gql(GQLLogExport, args)
+        request = {"since": args.since, "until": args.until, "flow_run_ids": read_ids(args.flow_run) if args.flow_run else None, "shard": args.shard}
+        try:
+            report = export.LogExport(gql, args.export, request, args.workers or batch.DEFAULT_WORKERS, args.state).run()
+        except ValueError as e:
+            _log.error(str(e))
+            sys.exit(1)
+        writer = output.get_writer(args.format, ["FILE", "SHARDS", "RESUMED", "ROWS", "BYTES"], sample_rows=0)
+        writer.write_page([[args.export] + report], lambda rows: rows)
+        writer.close()
+
     elif args.command == "api" and args.execute:
         variables = build_variables(args.variables)
-        class_instance = load_class(args.execute)()
-        class_instance.execute(variables).print(args.format)
-
-
-
-    _log.info(f"Aplication end, pid={os.getpid()}")
+        if len(args.execute) == 1:
+            print_or_watch(create_gql(load_class(args.execute[0]), args), variables, args)
+        elif args.watch:
+            _log.error("--watch allows only one class")
+            sys.exit(1)
+        else:
+            # asyncio is loaded only to run several classes
+            from ktxo.prefect.admin.gql import aio
+            items = [(create_gql(load_class(name), args), variables) for name in args.execute]
+            for i, gql in enumerate(aio.execute_all(items, args.workers or batch.DEFAULT_WORKERS)):
+                if i > 0 and args.format == "text" and not output.collecting():
+                    print()
+                gql.print(args.format)
 
 if __name__ == '__main__':
     main()
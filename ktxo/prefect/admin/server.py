@@ -0,0 +1,90 @@
+"""
+Resident mode: run many commands in one process (warm client, imports and cache)
+- serve(): accept command lines over a local Unix socket
+- send(): thin client, forward a command line to serve()
+- repl(): interactive session
+Protocol: one JSON line per connection, request {"argv": [...], "stdin": "..."}, response {"rc": 0, "output": "..."}
+"""
+import getpass
+import json
+import logging
+import os
+import shlex
+import socket
+import socketserver
+import sys
+import tempfile
+from typing import Callable, List, Tuple
+
+_log = logging.getLogger("ktxo.prefect.admin")
+
+def default_socket() -> str:
+    """$XDG_RUNTIME_DIR (or /tmp)/prefect_wrapper-UID.sock, computed on use: os.getuid() doesn't exist on Windows"""
+    user = os.getuid() if hasattr(os, "getuid") else getpass.getuser()
+    return os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"prefect_wrapper-{user}.sock")
+
+def serve(socket_path:str, handler:Callable[[List[str], str], Tuple[int, str]]):
+    """Serve commands until interrupted, handler(argv, stdin) -> (exit code, output)"""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline())
+                rc, output = handler(request["argv"], request.get("stdin"))
+            except Exception as e:
+                _log.exception(f"Invalid request, {str(e)}")
+                rc, output = 1, f"Invalid request, {str(e)}\n"
+            self.wfile.write((json.dumps({"rc": rc, "output": output}) + "\n").encode("utf-8"))
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    # Commands run one at a time: output is captured redirecting sys.stdout
+    with socketserver.UnixStreamServer(socket_path, Handler) as server:
+        os.chmod(socket_path, 0o600)
+        _log.warning(f"Listening on {socket_path}, pid={os.getpid()}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+def send(socket_path:str, argv:List[str]) -> int:
+    """Forward argv to serve(), print output and return exit code"""
+    stdin = sys.stdin.read() if "-" in argv else None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        s.sendall((json.dumps({"argv": argv, "stdin": stdin}) + "\n").encode("utf-8"))
+        with s.makefile("rb") as fd:
+            response = json.loads(fd.readline())
+    sys.stdout.write(response["output"])
+    return response["rc"]
+
+def repl(handler:Callable[[List[str], str], Tuple[int, str]], prompt:str="> "):
+    """Read command lines from stdin until 'exit', 'quit' or EOF"""
+    try:
+        import readline  # noqa: F401, history and line editing when available
+    except ImportError:
+        pass
+    while True:
+        try:
+            line = input(prompt).strip()
+        except EOFError:
+            print()
+            break
+        except KeyboardInterrupt:
+            print()
+            continue
+        if line in ["exit", "quit"]:
+            break
+        if line == "":
+            continue
+        try:
+            argv = shlex.split(line)
+        except ValueError as e:
+            print(f"Invalid command line, {str(e)}")
+            continue
+        rc, output = handler(argv, None)
+        sys.stdout.write(output)
+        if rc != 0:
+            print(f"(exit code {rc})")
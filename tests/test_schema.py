@@ -0,0 +1,78 @@
+import pytest
+
+from ktxo.prefect.admin.gql import extract, schema
+from ktxo.prefect.admin.gql.schema import Column
+
+COLUMNS = [Column("id", "ID"),
+           Column("agent.id", "AGENT_ID"),
+           Column("agent.name", "AGENT"),
+           Column("start_time", "START", "date"),
+           Column("run_config.labels", "RUN_LABELS", "json"),
+           Column("run_config.env.HOME", "RUN_HOME", "json"),
+           Column("flows_aggregate.aggregate.count", "NUM_FLOWS", select="flows_aggregate(distinct_on:flow_group_id){aggregate{count}}")]
+
+def by_name(*names):
+    return schema.select(COLUMNS, list(names))
+
+#---------------------------------------------------------------------------
+def test_select():
+    assert [c.name for c in by_name("agent", "id")] == ["AGENT", "ID"]
+    # By path too
+    assert by_name("agent.name") == [COLUMNS[2]]
+    with pytest.raises(ValueError, match="Unknown column 'NOPE'"):
+        by_name("NOPE")
+
+def test_selection_set_nested():
+    selection, nest = schema.selection_set(by_name("ID", "AGENT_ID", "AGENT", "START"))
+    assert selection == "id, agent {id, name}, start_time"
+    assert nest == {}
+
+def test_selection_set_extra():
+    selection, _ = schema.selection_set(by_name("AGENT"), ["id", "updated"])
+    assert selection == "agent {name}, id, updated"
+
+def test_selection_set_select_as_is():
+    selection, _ = schema.selection_set(by_name("ID", "NUM_FLOWS"))
+    assert selection == "id, flows_aggregate(distinct_on:flow_group_id){aggregate{count}}"
+
+def test_selection_set_json_alias():
+    selection, nest = schema.selection_set(by_name("RUN_LABELS", "RUN_HOME"))
+    assert selection == 'run_config__labels: run_config(path: "labels"), run_config__env__HOME: run_config(path: "env.HOME")'
+    assert nest == {"run_config__labels": ("run_config", ["labels"]), "run_config__env__HOME": ("run_config", ["env", "HOME"])}
+
+def test_selection_set_json_whole_column():
+    # The whole JSON column makes the aliased sub paths unnecessary
+    columns = by_name("RUN_LABELS") + [Column("run_config", "RUN_CONFIG", "json")]
+    selection, nest = schema.selection_set(columns)
+    assert selection == "run_config"
+    assert nest == {}
+
+def test_unnest_round_trip():
+    columns = by_name("ID", "AGENT", "RUN_LABELS", "RUN_HOME")
+    _, nest = schema.selection_set(columns)
+    # Response to the aliased selection
+    values = [{"id": "1", "agent": {"name": "a1"}, "run_config__labels": ["L1"], "run_config__env__HOME": "/home/x"},
+              {"id": "2", "agent": None, "run_config__labels": None, "run_config__env__HOME": None}]
+    values = schema.unnest(values, nest)
+    assert values[0] == {"id": "1", "agent": {"name": "a1"}, "run_config": {"labels": ["L1"], "env": {"HOME": "/home/x"}}}
+    assert values[1] == {"id": "2", "agent": None, "run_config": {"labels": None, "env": {"HOME": None}}}
+    plan = extract.compile_fields([c.path for c in columns], [])
+    assert [[get(v) for get in plan] for v in values] == [["1", "a1", ["L1"], "/home/x"], ["2", None, None, None]]
+
+#---------------------------------------------------------------------------
+def test_compile_fields_paths():
+    plan = extract.compile_fields(["id", "agent.name", "a.b.c"], [])
+    assert [get({"id": 1, "agent": {"name": "x"}, "a": {"b": "not a dict"}}) for get in plan] == [1, "x", None]
+    assert [get(None) for get in plan] == [None, None, None]
+
+def test_compile_fields_jmespath():
+    plan = extract.compile_fields(["labels[0]", "length(labels)"], [])
+    assert [get({"labels": ["L1", "L2"]}) for get in plan] == ["L1", 2]
+
+def test_compile_fields_dates():
+    plan = extract.compile_fields(["start_time"], ["start_time"])
+    assert plan[0]({"start_time": None}) is None
+    assert plan[0]({"start_time": "2021-12-01T10:00:00+00:00"}) == extract.format_date("2021-12-01T10:00:00.000000+00:00")
+
+def test_compile_fields_cached():
+    assert extract.compile_fields(["id"], []) is extract.compile_fields(["id"], [])
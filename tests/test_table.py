@@ -0,0 +1,107 @@
+import pytest
+
+from ktxo.prefect.admin.gql import table
+from ktxo.prefect.admin.gql.table import ResultTable
+
+COLS = ["NAME", "STATE", "RUNS", "LABELS"]
+ROWS = [["a", "Success", 10, ["L1"]],
+        ["b", "Failed", 2, None],
+        ["c", "Failed", None, ["L1"]],
+        ["d", "Success", 7, ["L2"]],
+        ["e", "Running", 30, None]]
+
+def result_table(rows=ROWS):
+    return ResultTable.from_pages(COLS, [rows[:2], rows[2:]])
+
+def names(t):
+    return [r[0] for rows in t.iter_rows() for r in rows]
+
+#---------------------------------------------------------------------------
+def test_parse_filter():
+    assert table.parse_filter("STATE=Failed") == ("STATE", "=", "Failed")
+    assert table.parse_filter(" RUNS >= 10 ") == ("RUNS", ">=", "10")
+    assert table.parse_filter("NAME!=") == ("NAME", "!=", "")
+    assert table.parse_filter("START>2021-12-01T10:00") == ("START", ">", "2021-12-01T10:00")
+    with pytest.raises(ValueError):
+        table.parse_filter("STATE")
+
+def test_parse_sort():
+    assert table.parse_sort("RUNS:desc, NAME") == [("RUNS", True), ("NAME", False)]
+    assert table.parse_sort("NAME:ASC") == [("NAME", False)]
+    assert table.parse_sort("") == []
+    with pytest.raises(ValueError):
+        table.parse_sort("NAME:up")
+
+def test_from_pages():
+    t = result_table()
+    assert len(t) == 5
+    assert names(t) == ["a", "b", "c", "d", "e"]
+    # Repeated strings are stored once
+    assert t.columns[1][1] is t.columns[1][2]
+
+def test_unknown_column():
+    with pytest.raises(ValueError, match="valid: NAME,STATE,RUNS,LABELS"):
+        result_table().filter("NOPE=1")
+
+#---------------------------------------------------------------------------
+def test_filter_equal():
+    assert names(result_table().filter("STATE=Failed")) == ["b", "c"]
+    assert names(result_table().filter("state!=Failed")) == ["a", "d", "e"]
+    # Compared as text, None is ''
+    assert names(result_table().filter("RUNS=7")) == ["d"]
+    assert names(result_table().filter("RUNS=")) == ["c"]
+    assert names(result_table().filter("LABELS=*'L1'*")) == ["a", "c"]
+
+def test_filter_pattern():
+    assert names(result_table().filter("STATE=*un*")) == ["e"]
+    assert names(result_table().filter("STATE!=?ailed")) == ["a", "d", "e"]
+
+def test_filter_compare():
+    # Numbers as numbers, None never matches
+    assert names(result_table().filter("RUNS>7")) == ["a", "e"]
+    assert names(result_table().filter("RUNS<=7")) == ["b", "d"]
+    # Text otherwise
+    assert names(result_table().filter("NAME>=c")) == ["c", "d", "e"]
+    assert names(result_table().filter("RUNS>x")) == []
+
+def test_filters_and():
+    t = result_table().filter("STATE=Success").filter("RUNS<8")
+    assert names(t) == ["d"]
+
+#---------------------------------------------------------------------------
+def test_sort():
+    assert names(result_table().sort("RUNS")) == ["b", "d", "a", "e", "c"]
+    # Nulls last also descending
+    assert names(result_table().sort("RUNS:desc")) == ["e", "a", "d", "b", "c"]
+
+def test_sort_several_keys():
+    assert names(result_table().sort("STATE,RUNS:desc")) == ["b", "c", "e", "a", "d"]
+
+def test_sort_mixed_types():
+    rows = [["a", 1, None, None], ["b", "x", None, None], ["c", 0, None, None]]
+    t = ResultTable.from_pages(["NAME", "V", "RUNS", "LABELS"], [rows]).sort("V")
+    assert names(t) == ["c", "a", "b"]
+
+def test_sort_after_filter():
+    assert names(result_table().filter("STATE!=Running").sort("NAME:desc")) == ["d", "c", "b", "a"]
+
+#---------------------------------------------------------------------------
+def test_group_by():
+    groups = result_table().group_by("STATE")
+    assert groups.cols == ["STATE", "ROWS"]
+    assert [r for rows in groups.iter_rows() for r in rows] == [["Success", 2], ["Failed", 2], ["Running", 1]]
+
+def test_group_by_after_filter():
+    groups = result_table().filter("RUNS>5").group_by("STATE").sort("ROWS:desc")
+    assert [r for rows in groups.iter_rows() for r in rows] == [["Success", 2], ["Running", 1]]
+
+def test_group_by_unhashable():
+    groups = result_table().group_by("LABELS")
+    assert [r for rows in groups.iter_rows() for r in rows] == [[["L1"], 2], [None, 2], [["L2"], 1]]
+
+def test_group_by_empty():
+    groups = result_table().filter("STATE=Cancelled").group_by("STATE")
+    assert len(groups) == 0
+
+def test_iter_rows_size():
+    assert [len(rows) for rows in result_table().iter_rows(size=2)] == [2, 2, 1]